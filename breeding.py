@@ -0,0 +1,126 @@
+'''
+Vectorized breeding for population studies.
+
+A genome is an uint8 array of shape (genes, 2): one row per field of `Genes`
+(species, fertility, lifespan, speed), each row holding the ordinals of the
+two alleles inside their gene enum (see `config.allele_ordinals`), which is
+exactly `Genes.packed` viewed as an array. All genes must be set. Batches of
+genomes are stacked along the first axis, so `crossingover_batch` takes and
+returns arrays of shape (n, genes, 2).
+
+Semantics follow `Genes.crossingover` and `Genes.mutate`, only the random
+draws are made for the whole batch at once.
+'''
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from config import BeeSpecies, allele_ordinals, dominant, genes_enums, mutation_tables
+from forestry import Genes, default_genes
+
+gene_names = list(Genes.fields)
+alleles_by_ordinal = [list(gene_enum) for gene_enum in genes_enums.values()]
+
+_gene_indices = np.arange(len(gene_names))
+
+# dominance[gene, ordinal]
+dominance = np.zeros((len(gene_names), max(map(len, alleles_by_ordinal))), dtype=bool)
+for gene_index, alleles in enumerate(alleles_by_ordinal):
+    for ordinal, allele in enumerate(alleles):
+        dominance[gene_index, ordinal] = dominant[allele]
+
+# default_genome[species ordinal, gene], used for the mutated parent's half
+default_genome = np.array([
+    [allele_ordinals[default_genes[species][name]] for name in gene_names]
+    for species in BeeSpecies
+], dtype=np.uint8)
+
+def _dense_mutation_arrays(gene_enum):
+    '''
+    `config.mutation_tables` as arrays: cumulative[allele1, allele2, k] is the
+    cumulative probability of the first k+1 outcomes and outcomes holds their
+    ordinals. Pairs with fewer outcomes are padded with the last cumulative
+    value and -1, so a sample past the last real outcome means "no mutation".
+    '''
+    n = len(gene_enum)
+    table = mutation_tables[gene_enum]
+    max_outcomes = max((len(cell[1]) for cell in table if cell is not None), default=0)
+    cumulative = np.ones((n, n, max_outcomes))
+    outcomes = np.full((n, n, max_outcomes + 1), -1, dtype=np.int16)
+    for index, cell in enumerate(table):
+        if cell is not None:
+            i, j = divmod(index, n)
+            probabilities, offspring = cell
+            cumulative[i, j, :] = probabilities[-1]
+            cumulative[i, j, :len(probabilities)] = probabilities
+            outcomes[i, j, :len(offspring)] = [allele_ordinals[allele] for allele in offspring]
+    return cumulative, outcomes
+
+mutation_cumulative, mutation_outcomes = _dense_mutation_arrays(BeeSpecies)
+
+_default_rng = np.random.default_rng()
+
+
+def encode_genes(genes_list: Iterable[Genes]) -> np.ndarray:
+    packed = b''.join(genes.packed for genes in genes_list)
+    return np.frombuffer(packed, dtype=np.uint8).reshape(-1, len(gene_names), 2).copy()
+
+
+def decode_genes(genomes: np.ndarray) -> List[Genes]:
+    genomes = np.ascontiguousarray(genomes, dtype=np.uint8)
+    return [Genes.from_packed(genome.tobytes()) for genome in genomes]
+
+
+def sample_mutations(species1: np.ndarray, species2: np.ndarray, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    '''Draws one mutation per pair of species ordinals, -1 where nothing mutated'''
+    rng = rng or _default_rng
+    species1 = np.asarray(species1)
+    species2 = np.asarray(species2)
+    samples = rng.random(len(species1))
+    outcome_index = (samples[:, None] >= mutation_cumulative[species1, species2]).sum(axis=1)
+    return mutation_outcomes[species1, species2, outcome_index]
+
+
+def mutate_batch(species1: np.ndarray, species2: np.ndarray, rng: Optional[np.random.Generator] = None) -> Tuple[np.ndarray, np.ndarray]:
+    '''Batched `Genes.mutate` for arrays of species ordinals'''
+    rng = rng or _default_rng
+    species1 = np.asarray(species1)
+    species2 = np.asarray(species2)
+    outcome = sample_mutations(species1, species2, rng)
+    mutated = outcome >= 0
+    first = rng.random(len(species1)) < 0.5
+
+    new_species1 = np.where(mutated & first, outcome, species1).astype(np.uint8)
+    new_species2 = np.where(mutated & ~first, outcome, species2).astype(np.uint8)
+    return new_species1, new_species2
+
+
+def crossingover_batch(genomes1: np.ndarray, genomes2: np.ndarray, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    '''Batched `Genes.crossingover`: child i is bred from genomes1[i] and genomes2[i]'''
+    rng = rng or _default_rng
+    genomes1 = np.asarray(genomes1, dtype=np.uint8)
+    genomes2 = np.asarray(genomes2, dtype=np.uint8)
+    n = len(genomes1)
+
+    species_coins = rng.random((n, 2)) < 0.5
+    species1 = np.where(species_coins[:, 0], genomes1[:, 0, 0], genomes1[:, 0, 1])
+    species2 = np.where(species_coins[:, 1], genomes2[:, 0, 0], genomes2[:, 0, 1])
+    new_species1, new_species2 = mutate_batch(species1, species2, rng)
+    mutated_1 = new_species1 != species1
+    mutated_2 = ~mutated_1 & (new_species2 != species2)
+
+    allele_coins = rng.random((n, len(gene_names), 2)) < 0.5
+    allele1 = np.where(allele_coins[..., 0], genomes1[..., 0], genomes1[..., 1])
+    allele2 = np.where(allele_coins[..., 1], genomes2[..., 0], genomes2[..., 1])
+    allele1[mutated_1] = default_genome[new_species1[mutated_1]]
+    allele2[mutated_2] = default_genome[new_species2[mutated_2]]
+
+    # dominant allele goes first, ties are ordered by a coin flip
+    dominant1 = dominance[_gene_indices, allele1]
+    dominant2 = dominance[_gene_indices, allele2]
+    order_coins = rng.random((n, len(gene_names))) < 0.5
+    swap = np.where(dominant1 == dominant2, ~order_coins, dominant2)
+    return np.stack([
+        np.where(swap, allele2, allele1),
+        np.where(swap, allele1, allele2),
+    ], axis=-1).astype(np.uint8)
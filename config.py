@@ -1,7 +1,9 @@
-import codecs
+import hashlib
+import marshal
 import os
 from enum import Enum
-from typing import Dict
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
 
 import yaml
 
@@ -13,8 +15,45 @@ class NameEnum(Enum):
     def __str__(self):
         return self.name
 
-with open('config.yaml') as f:
-    config = yaml.safe_load(f)
+def load_yaml(filename, encoding='utf-8'):
+    '''
+    Parses a yaml file, the result is kept in a marshal cache in __pycache__
+    (not next to the file, `locals` is listed for languages). The cache is
+    keyed by the mtime and size of the file and, when those changed, by its
+    hash, so touching a file doesn't reparse it and editing it always does.
+    Only the parsed documents are cached, the enums below are created anew in
+    every process.
+    '''
+    cache_dir = '__pycache__'
+    cache_path = os.path.join(cache_dir, os.path.normpath(filename).replace(os.sep, '.') + '.marshal')
+    stat = os.stat(filename)
+    cached = None
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = marshal.load(f) # (yaml version, mtime, size, sha256, data)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    if cached is not None and cached[0] == yaml.__version__ and cached[1:3] == (stat.st_mtime_ns, stat.st_size):
+        return cached[4]
+
+    with open(filename, 'rb') as f:
+        source = f.read()
+    digest = hashlib.sha256(source).hexdigest()
+    if cached is not None and cached[0] == yaml.__version__ and cached[3] == digest:
+        data = cached[4]
+    else:
+        data = yaml.safe_load(source.decode(encoding))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp' # processes starting together don't share it
+        with open(tmp_path, 'wb') as f:
+            marshal.dump((yaml.__version__, stat.st_mtime_ns, stat.st_size, digest, data), f)
+        os.replace(tmp_path, cache_path)
+    except (OSError, ValueError): # read-only install, or data marshal can't hold
+        pass
+    return data
+
+config = load_yaml('config.yaml')
 
 # some ui stuff
 UI_MESSAGE_SIZE = (500, 300)
@@ -36,6 +75,12 @@ for gene_name, list_of_alleles in genes_conf.items():
         dominant[gene_enum[allele_name]] = dominance
 BeeSpecies, BeeFertility, BeeLifespan, BeeSpeed = genes_enums.values()
 
+# position of every allele inside its gene, used by the compact genome encodings
+allele_ordinals : Dict[LocalEnum, int] = {}
+for gene_enum in genes_enums.values():
+    for ordinal, allele in enumerate(gene_enum):
+        allele_ordinals[allele] = ordinal
+
 tiers_conf = config['tier']
 tiers: Dict[LocalEnum, int] = {}
 for gene_name, dict_of_tiers in tiers_conf.items():
@@ -65,6 +110,22 @@ for k in mutations:
     mutations[k][0].append(None)
     mutations[k][1].append(1 - sum(mutations[k][1]))
 
+# dense NxN mutation tables per gene, indexed by `ordinal1 * N + ordinal2`
+# each cell is None (no mutation) or (cumulative probabilities, offspring alleles),
+# so a draw is one index and one uniform sample bisected into the probabilities
+mutation_tables : Dict[type, List[Optional[Tuple[Tuple[float, ...], Tuple[LocalEnum, ...]]]]] = {}
+for gene_enum in genes_enums.values():
+    mutation_tables[gene_enum] = [None] * (len(gene_enum) * len(gene_enum))
+for (parent1, parent2), (offspring, weights) in mutations.items():
+    gene_enum = type(parent1)
+    index = allele_ordinals[parent1] * len(gene_enum) + allele_ordinals[parent2]
+    mutation_tables[gene_enum][index] = (tuple(accumulate(weights[:-1])), tuple(offspring[:-1]))
+
+# mutation partners of every allele: allele -> [(other parent, offspring, probabilities)]
+mutation_partners : Dict[LocalEnum, List[Tuple[LocalEnum, List[LocalEnum], List[float]]]] = {}
+for (parent1, parent2), (offspring, weights) in mutations.items():
+    mutation_partners.setdefault(parent1, []).append((parent2, offspring[:-1], weights[:-1]))
+
 # resources and products
 ResourceTypes = NameEnum('ResourceTypes', zip(config['resources'], range(len(config['resources']))))
 
@@ -101,7 +162,10 @@ def load_settings(filename='settings.yaml'):
         'fullscreen': True,
         'master_volume': 1,
         'click_volume': 1,
-        'language': 'en'
+        'language': 'en',
+        'autosave_interval': 300, # ticks, 0 turns autosaves off
+        'autosave_slots': 3,
+        'save_compression': 'zlib', # 'zlib', 'lzma' or None
     }
 
     if os.path.exists(filename):
@@ -112,8 +176,7 @@ def load_settings(filename='settings.yaml'):
 
 language = load_settings()['language']
 filename = f'./locals/{language}.yaml'
-with codecs.open(filename, "r", "utf_8_sig" ) as f:
-    local_conf = yaml.safe_load(f)
+local_conf = load_yaml(filename, 'utf_8_sig')
 
 local = {}
 straight = ['genes', 'bee_genders', 'buildings', 'esc_menu', 'achievements', 'achievements_misc', 'mendel_text_additionals']
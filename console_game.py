@@ -13,8 +13,11 @@ class Command:
     short_desc: str = ''
 
 class ConsoleGame(Game):
-    def __init__(self) -> None:
-        super().__init__()
+    # commands that change the state of the game, these are recorded by the journal
+    journaled_commands = {'put', 'take', 'reput', 'throw', 'swap', 'sort', 'forage', 'inspect', 'build', 'b'}
+
+    def __init__(self, real_time=True, render_thread=True) -> None:
+        super().__init__(real_time)
         self.to_render = [self.resources, self.inv, self.apiaries[0]]
 
         self.manual = self.parse_manual()
@@ -38,7 +41,7 @@ class ConsoleGame(Game):
             Command(['reput'], self.reput, *desc['reput']),
             Command(['throw'], self.throw, *desc['throw']),
             Command(['swap'], self.swap, *desc['swap']),
-            Command(['sort'], self.inv.sort, *desc['sort']),
+            Command(['sort'], lambda: self.inv.sort(), *desc['sort']),
             Command(['forage'], self.forage, *desc['forage']),
             Command(['inspect'], self.inspect, *desc['inspect']),
             Command(['build', 'b'], self.build, *desc['build']),
@@ -55,27 +58,35 @@ class ConsoleGame(Game):
         self.render_event = threading.Event()
         self.render_event.set()
 
-        
-        self.render_thread = threading.Thread(target=self.render)
-        self.render_thread.start()
+        # without the thread frames are rendered right away by whoever changed the state
+        self.render_thread = None
+        if render_thread:
+            self.render_thread = threading.Thread(target=self.render)
+            self.render_thread.start()
 
     def render_frame(self):
-        if self.render_event.is_set():
-            if self.render_help.is_set():
-                self.print(self.help_text, flush=True)
-            else:
-                if len(self.to_render) == 0:
-                    self.print(flush=True)
-                    self.render_event.clear()
-                    return
-                for thing in self.to_render[:-1]:
-                    self.print(thing)
-                    self.print()
-                self.print(self.to_render[-1], flush=True)
-            self.render_event.clear()
+        # under the lock a frame is never interleaved with another one, a command or a tick
+        with self.state_lock:
+            if self.render_event.is_set():
+                self.render_event.clear() # before rendering, so changes made meanwhile get the next frame
+                if self.render_help.is_set():
+                    self.print(self.help_text, flush=True)
+                else:
+                    if len(self.to_render) == 0:
+                        self.print(flush=True)
+                        return
+                    for thing in self.to_render[:-1]:
+                        self.print(thing)
+                        self.print()
+                    self.print(self.to_render[-1], flush=True)
 
     def state_updated(self):
+        self.request_frame()
+
+    def request_frame(self):
         self.render_event.set()
+        if self.render_thread is None:
+            self.render_frame()
 
     @staticmethod
     def parse_manual():
@@ -98,8 +109,11 @@ class ConsoleGame(Game):
     def execute_command(self, value):
         command, *params = value.split()
         f = self.get_command(command)
-        f(*params)
-        self.render_event.set()
+        with self.state_lock:
+            f(*params)
+            if self.journal is not None and command in self.journaled_commands:
+                self.journal.record_command(value)
+        self.request_frame()
     
     def show_manual(self):
         self.help_text = self.manual[self.current_manual_page]
@@ -161,5 +175,5 @@ class ConsoleGame(Game):
     
     def load(self, name):
         saved = super().load(name)
-        self.to_render = saved['to_render']
+        self.to_render = saved.get('to_render', [self.resources, self.inv])
         return saved
\ No newline at end of file
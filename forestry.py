@@ -1,21 +1,30 @@
 import dataclasses
+import heapq
+import io
+import itertools
 import logging
 import os
-import pickle
 import random
 import textwrap
 import threading
 import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
 from collections import defaultdict
 from dataclasses import dataclass, fields
 from enum import Enum, IntEnum, auto
+from functools import lru_cache, partial
+from operator import attrgetter
 from pprint import pprint
 from traceback import print_exc
-from typing import Any, Callable, List, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
 
 from config import (BeeFertility, BeeLifespan, BeeSpecies, BeeSpeed,
-                    ResourceTypes, config_production_modifier, dominant,
-                    helper_text, local, mendel_text, mutations, products,
+                    ResourceTypes, allele_ordinals, config_production_modifier,
+                    dominant, genes_enums, helper_text, local, mendel_text,
+                    mutation_partners, mutation_tables, products,
                     amount_needed_to_analyze, tiers)
 
 
@@ -101,26 +110,81 @@ Allele = Union[BeeSpecies, BeeFertility, BeeLifespan, BeeSpeed]
 Gene = Tuple[Allele, Allele]
 
 
-@dataclass(eq=True, frozen=True)
+NO_ALLELE = 255 # packed value of a gene that is not set
+
+def _gene_property(index: int):
+    alleles = tuple(list(genes_enums.values())[index])
+    def getter(self: 'Genes'):
+        allele1 = self.packed[2 * index]
+        if allele1 == NO_ALLELE:
+            return None
+        return alleles[allele1], alleles[self.packed[2 * index + 1]]
+    return property(getter)
+
+
 class Genes:
-    species: Gene
-    fertility: Gene = None
-    lifespan: Gene = None
-    speed: Gene = None
+    '''
+    Immutable genome packed into `bytes`, one byte per allele holding its
+    ordinal inside the gene enum (see `config.allele_ordinals`).
+    Genes are read back as tuples of enum members: `genes.species == (bs.FOREST, bs.MEADOWS)`.
+    '''
+    __slots__ = ('packed',)
+    fields = ('species', 'fertility', 'lifespan', 'speed')
+
+    species = _gene_property(0)
+    fertility = _gene_property(1)
+    lifespan = _gene_property(2)
+    speed = _gene_property(3)
+
+    def __init__(self, species: Gene, fertility: Gene = None, lifespan: Gene = None, speed: Gene = None):
+        packed = bytearray()
+        for gene in (species, fertility, lifespan, speed):
+            if gene is None:
+                packed += bytes((NO_ALLELE, NO_ALLELE))
+            else:
+                packed += bytes((allele_ordinals[gene[0]], allele_ordinals[gene[1]]))
+        object.__setattr__(self, 'packed', bytes(packed))
+
+    @staticmethod
+    def from_packed(packed: bytes) -> 'Genes':
+        genes = Genes.__new__(Genes)
+        object.__setattr__(genes, 'packed', bytes(packed))
+        return genes
+
+    def __setattr__(self, name, value):
+        raise dataclasses.FrozenInstanceError(f'cannot assign to field {name!r}')
+
+    def __eq__(self, other):
+        return isinstance(other, Genes) and self.packed == other.packed
+
+    def __hash__(self):
+        return hash(self.packed)
+
+    def __repr__(self):
+        return 'Genes(' + ', '.join(f'{key}={getattr(self, key)!r}' for key in Genes.fields) + ')'
+
+    def __getstate__(self):
+        return self.packed
+
+    def __setstate__(self, state):
+        if isinstance(state, dict): # saves made when Genes was a dataclass hold its __dict__
+            state = Genes(**state).packed
+        object.__setattr__(self, 'packed', state)
 
     def asdict(self):
-        d = dataclasses.asdict(self)
+        d = {key: getattr(self, key) for key in Genes.fields}
         d = dict(filter(lambda x: x[1] is not None, d.items()))
         return d
 
     @staticmethod
     def mutate(allele1, allele2):
-        mut = mutations.get((allele1, allele2))
-        if mut is not None:  # mutation found in mutation map
-            allele = random.choices(mut[0], weights=mut[1])[
-                0
-            ]  # sample with weights from mutation map
-            if allele is not None:
+        gene_enum = type(allele1)
+        mut = mutation_tables[gene_enum][allele_ordinals[allele1] * len(gene_enum) + allele_ordinals[allele2]]
+        if mut is not None:  # mutation found in mutation table
+            cumulative, offspring = mut
+            index = bisect_right(cumulative, random.random())
+            if index < len(offspring):  # past the last cumulative probability means no mutation
+                allele = offspring[index]
                 return weighted_if(
                     0.5, (allele, allele2), (allele1, allele)
                 )  # gene from mutation
@@ -163,6 +227,13 @@ class Genes:
                 l.append(weighted_if(0.5, (allele1, allele2), (allele2, allele1)))
         return Genes(*l)
 
+    def offspring_distribution(self, other: 'Genes') -> Dict['Genes', float]:
+        '''Exact probability of every genotype `self.crossingover(other)` can produce'''
+        # crossingover is symmetric in its parents, so one cache entry serves both orders
+        if other.packed < self.packed:
+            return dict(_offspring_distribution(other, self))
+        return dict(_offspring_distribution(self, other))
+
     @staticmethod
     def sample(basic=True):
         if basic:
@@ -170,9 +241,64 @@ class Genes:
             genes = default_genes[species]
             return Genes(**{k: (g, g) for k, g in genes.items()})
 
+def _ordered_pairs(alleles1, alleles2):
+    '''Distribution of (dominant, recessive) pairs for weighted alleles taken from each parent'''
+    pairs = defaultdict(float)
+    for allele1, p1 in alleles1:
+        for allele2, p2 in alleles2:
+            p = p1 * p2
+            if dominant[allele1] and not dominant[allele2]:
+                pairs[(allele1, allele2)] += p
+            elif not dominant[allele1] and dominant[allele2]:
+                pairs[(allele2, allele1)] += p
+            else:
+                pairs[(allele1, allele2)] += p / 2
+                pairs[(allele2, allele1)] += p / 2
+    return pairs
+
+@lru_cache(maxsize=4096)
+def _offspring_distribution(genes1: Genes, genes2: Genes) -> Dict[Genes, float]:
+    # which parent (if any) mutated and into what: None, (1, species) or (2, species)
+    mutation_states = defaultdict(float)
+    for spec1 in genes1.species:
+        for spec2 in genes2.species:
+            p = 0.25
+            gene_enum = type(spec1)
+            mut = mutation_tables[gene_enum][allele_ordinals[spec1] * len(gene_enum) + allele_ordinals[spec2]]
+            mutated_total = 0
+            if mut is not None:
+                cumulative, offspring = mut
+                for cum, allele in zip(cumulative, offspring):
+                    q = p * (cum - mutated_total)
+                    mutated_total = cum
+                    mutation_states[(1, allele) if allele != spec1 else None] += q / 2
+                    mutation_states[(2, allele) if allele != spec2 else None] += q / 2
+            mutation_states[None] += p * (1 - mutated_total)
+
+    genes1_dict = genes1.asdict()
+    genes2_dict = genes2.asdict()
+    res = defaultdict(float)
+    for state, p_state in mutation_states.items():
+        per_gene = []
+        for key in genes1_dict:
+            alleles1 = [(allele, 0.5) for allele in genes1_dict[key]]
+            alleles2 = [(allele, 0.5) for allele in genes2_dict[key]]
+            if state is not None and state[0] == 1:
+                alleles1 = [(default_genes[state[1]][key], 1)]
+            elif state is not None and state[0] == 2:
+                alleles2 = [(default_genes[state[1]][key], 1)]
+            per_gene.append(list(_ordered_pairs(alleles1, alleles2).items()))
+        for combination in itertools.product(*per_gene):
+            p = p_state
+            for _, p_pair in combination:
+                p *= p_pair
+            res[Genes(*(pair for pair, _ in combination))] += p
+    return res
+
 def dom_local(allele, dom):
     return allele.upper() if dom else allele.lower()
 class Bee:
+    __slots__ = ('genes', 'inspected', 'mating_entries')
     type_str = 'unknown'
     def __init__(self, genes: Genes, inspected: bool = False):
         self.genes = genes
@@ -187,7 +313,7 @@ class Bee:
             return '\n'.join(res)
         name, bee_species_index = local[self.type_str]
         res.append(name)
-        genes = vars(self.genes)
+        genes = self.genes.asdict()
         res.append(local['trait'])
         for key in genes:
             try:
@@ -204,6 +330,16 @@ class Bee:
     def __hash__(self):
         return hash(self.genes)
 
+    def __setstate__(self, state):
+        if isinstance(state, tuple): # (__dict__, __slots__) pair
+            state = {**(state[0] or {}), **state[1]}
+        # saves made before bees had __slots__ hold a plain __dict__
+        for name, value in state.items():
+            try:
+                setattr(self, name, value)
+            except AttributeError: # attribute that bees no longer have
+                pass
+
     def __eq__(self, other: 'Bee'):
         return type(self) == type(other) and self.genes == other.genes and self.inspected == other.inspected
 
@@ -235,6 +371,7 @@ class Bee:
 
 
 class Queen(Bee):
+    __slots__ = ('parent1', 'parent2', 'generation', 'lifespan', 'remaining_lifespan', 'children')
     type_str = 'Queen'
     def __init__(self, parent1: 'Princess', parent2: 'Drone', inspected: bool = False):
         self.parent1 = parent1
@@ -257,6 +394,7 @@ class Queen(Bee):
 
 
 class Princess(Bee):
+    __slots__ = ('generation',)
     type_str = 'Princess'
     def __init__(self, genes, inspected: bool = False, generation: int = 0):
         self.generation = generation
@@ -269,6 +407,7 @@ class Princess(Bee):
 
 
 class Drone(Bee):
+    __slots__ = ()
     type_str = 'Drone'
     def __init__(self, genes, inspected: bool = False):
         super().__init__(genes, inspected)
@@ -330,21 +469,56 @@ class Resources:
         return self.res.items()
 
 class Bestiary:
+    '''
+    Besides the per species tables keeps running totals of produced resources.
+    Subscribers are called as `listener(counter, value)` whenever a counter
+    grows, counters being ('produced', ResourceTypes) and ('bred', BeeSpecies).
+    '''
     def __init__(self):
         self.produced_resources = {species: defaultdict(int) for species in BeeSpecies}
         self.known_bees = defaultdict(int)
+        self.produced_totals = defaultdict(int)
+        self.listeners : List[Callable[[Tuple, int], None]] = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['produced_totals'] # derived
+        del state['listeners'] # the game subscribes again after loading
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.listeners = []
+        self.produced_totals = defaultdict(int)
+        for resources in self.produced_resources.values():
+            for res, amount in resources.items():
+                self.produced_totals[res] += amount
+
+    def subscribe(self, listener: Callable[[Tuple, int], None]):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[Tuple, int], None]):
+        self.listeners.remove(listener)
+
+    def counter_changed(self, counter, value):
+        for listener in self.listeners:
+            listener(counter, value)
 
     def add_produced_resources(self, bee_species, resources):
         for res in resources:
             self.produced_resources[bee_species][res] += resources[res]
+            self.produced_totals[res] += resources[res]
+            self.counter_changed(('produced', res), self.produced_totals[res])
 
     def add_offspring(self, bee_species: BeeSpecies, amount=1):
         self.known_bees[bee_species] += amount
+        self.counter_changed(('bred', bee_species), self.known_bees[bee_species])
 
     def copy(self):
         new_bestiary = Bestiary()
         new_bestiary.produced_resources = {species: d.copy() for species, d in self.produced_resources.items()}
         new_bestiary.known_bees = self.known_bees.copy()
+        new_bestiary.produced_totals = self.produced_totals.copy()
         return new_bestiary
 
     def __eq__(self, other: 'Bestiary') -> bool:
@@ -363,6 +537,10 @@ class Achievement:
     def check(self, game: 'Game'):
         return False
 
+    def counters(self) -> Optional[Dict[Tuple, int]]:
+        '''Bestiary counters the achievement depends on with their thresholds, None to be checked every tick'''
+        return None
+
     def reward(self, game: 'Game'):
         pass
 
@@ -373,11 +551,10 @@ class ProducedProducts(Achievement):
         super().__init__(requirement, reward, comment, achieved)
 
     def check(self, game: 'Game'):
-        per_product = []
-        for product, n in self.products.items():
-            b = sum(map(lambda x: x.get(product, 0), game.bestiary.produced_resources.values())) >= n
-            per_product.append(b)
-        return all(per_product)
+        return all(game.bestiary.produced_totals.get(product, 0) >= n for product, n in self.products.items())
+
+    def counters(self):
+        return {('produced', product): n for product, n in self.products.items()}
 
     def reward(self, game: 'Game'):
         game.resources.add_resources(self.reward_resources)
@@ -390,21 +567,66 @@ class BredSpecies(Achievement):
     def check(self, game: 'Game'):
         return self.species in game.bestiary.known_bees
 
+    def counters(self):
+        return {('bred', self.species): 1}
+
 class AchievementManager:
+    '''
+    Achievements subscribe to the bestiary counters they depend on and are
+    only checked after one of their thresholds was crossed, so checking costs
+    nothing while no counter moves. Achievements without counters are checked
+    every time.
+    '''
     def __init__(self, game: 'Game', achievements: List[Achievement], notify: Callable[[Achievement], None]):
         self.game = game
-        self.achievements = achievements
         self.notify = notify
         self.changed_recently = False
+        self.bestiary = None
+        self.set_achievements(achievements)
+        self.attach(game.bestiary)
+
+    def set_achievements(self, achievements: List[Achievement]):
+        self.achievements = achievements
+        self.thresholds : Dict[Tuple, List[Tuple[int, int]]] = defaultdict(list) # counter -> heap of (threshold, achievement index)
+        self.polled : List[int] = []
+        self.woken = set()
+        for index, achievement in enumerate(achievements):
+            if achievement.achieved:
+                continue
+            counters = achievement.counters()
+            if counters is None:
+                self.polled.append(index)
+                continue
+            for counter, threshold in counters.items():
+                heapq.heappush(self.thresholds[counter], (threshold, index))
+            self.woken.add(index) # counters may be past the thresholds already
+
+    def attach(self, bestiary: Bestiary):
+        if self.bestiary is not None:
+            self.bestiary.unsubscribe(self.counter_changed)
+        self.bestiary = bestiary
+        bestiary.subscribe(self.counter_changed)
+        self.woken.update(index for index, achievement in enumerate(self.achievements) if not achievement.achieved)
+
+    def counter_changed(self, counter, value):
+        heap = self.thresholds.get(counter)
+        while heap and heap[0][0] <= value:
+            _, index = heapq.heappop(heap)
+            self.woken.add(index)
 
     def check_achievements(self):
-        for achievement in self.achievements:
+        if not self.woken and not self.polled:
+            return
+        woken, self.woken = self.woken, set()
+        for index in sorted(woken.union(self.polled)):
+            achievement = self.achievements[index]
             if not achievement.achieved:
                 if achievement.check(self.game):
                     achievement.achieved = True
                     achievement.reward(self.game)
                     self.notify(achievement)
                     self.changed_recently = True
+        self.polled = [index for index in self.polled if not self.achievements[index].achieved]
 
 @dataclass
 class MatingEntry:
@@ -446,21 +668,138 @@ class MatingEntry:
         self.set_history_something_changed()
 
 
+mating_entry_key = attrgetter(*(field.name for field in fields(MatingEntry))) # equal keys <=> equal entries
+
+def front_entry_key(key: tuple) -> tuple:
+    '''Key of the entry as the player sees it: recessive alleles of uninspected bees are hidden'''
+    parent1_dom, parent1_rec, parent2_dom, parent2_rec, child_dom, child_rec, parent1_inspected, parent2_inspected, child_inspected = key
+    return (parent1_dom, parent1_rec if parent1_inspected else None,
+            parent2_dom, parent2_rec if parent2_inspected else None,
+            child_dom, child_rec if child_inspected else None,
+            parent1_inspected, parent2_inspected, child_inspected)
+
 class MatingHistory:
+    '''
+    `index` maps the key of every entry to its positions in `history`, in
+    ascending order: entries can become equal when their inspected flags are
+    set, and the first one is the one that gets counted. Counts are kept in
+    a compact array parallel to `history`.
+
+    The front view (what `get_history_counts` returns) is kept up to date in
+    the same way: every front row aggregates the entries with the same front
+    key and rows are ordered by their first entry. Rows touched since the last
+    `acknowledge_changes` are remembered for the ui.
+    '''
+    derived_attributes = ('index', 'keys', 'front_keys', 'front_members', 'front_counts', 'front_entries', 'front_order', 'changed_rows', 'rows_moved')
     def __init__(self):
-        self.history = []
-        self.counts = []
+        self.history : List[MatingEntry] = []
+        self.counts = array('L')
         self.something_changed = False
+        self.index = None
+        self.ensure_index()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.derived_attributes:
+            state.pop(name, None) # not there until the index is built
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.counts = array('L', self.counts)
+        self.index = None # entries may not be unpickled yet, see `ensure_index`
+
+    def ensure_index(self):
+        if self.index is None:
+            self.index : Dict[tuple, List[int]] = {}
+            self.keys : List[tuple] = []
+            self.front_keys : List[tuple] = []
+            self.front_members : Dict[tuple, List[int]] = {} # front key -> positions in history, ascending
+            self.front_counts : Dict[tuple, int] = {}
+            self.front_entries : Dict[tuple, MatingEntry] = {}
+            self.front_order : List[Tuple[int, tuple]] = [] # (first position, front key), sorted
+            self.changed_rows = set()
+            self.rows_moved = True
+            for position, entry in enumerate(self.history):
+                self.add_to_index(entry, position)
+
+    def bind_entries(self):
+        '''Lets the entries report changes before the index is built'''
+        for position, entry in enumerate(self.history):
+            entry.set_history_something_changed = partial(self.entry_changed, position)
+
+    def add_to_index(self, entry: MatingEntry, position: int):
+        entry.set_history_something_changed = partial(self.entry_changed, position) # dirty!
+        key = mating_entry_key(entry)
+        insort(self.index.setdefault(key, []), position)
+        front_key = front_entry_key(key)
+        if position == len(self.keys):
+            self.keys.append(key)
+            self.front_keys.append(front_key)
+        else:
+            self.keys[position] = key
+            self.front_keys[position] = front_key
+        self.add_to_front(front_key, position)
+
+    def remove_from_index(self, position: int):
+        key = self.keys[position]
+        positions = self.index[key]
+        positions.remove(position)
+        if not positions:
+            del self.index[key]
+        self.remove_from_front(self.front_keys[position], position)
+
+    def add_to_front(self, front_key: tuple, position: int):
+        members = self.front_members.get(front_key)
+        if members is None:
+            members = self.front_members[front_key] = []
+            self.front_counts[front_key] = 0
+            self.front_entries[front_key] = MatingEntry(*front_key)
+        elif members[0] > position:
+            self.front_order.pop(bisect_left(self.front_order, (members[0],)))
+        if not members or members[0] > position:
+            insort(self.front_order, (position, front_key))
+            self.rows_moved = True
+        insort(members, position)
+        self.front_counts[front_key] += self.counts[position]
+        self.changed_rows.add(front_key)
+
+    def remove_from_front(self, front_key: tuple, position: int):
+        members = self.front_members[front_key]
+        if members[0] == position:
+            self.front_order.pop(bisect_left(self.front_order, (position,)))
+            if len(members) > 1:
+                insort(self.front_order, (members[1], front_key))
+            self.rows_moved = True
+        members.remove(position)
+        self.front_counts[front_key] -= self.counts[position]
+        if not members:
+            del self.front_members[front_key]
+            del self.front_counts[front_key]
+            del self.front_entries[front_key]
+        self.changed_rows.add(front_key)
+
+    def entry_changed(self, position: int):
+        '''Called by the entry at `position` after one of its inspected flags was set'''
+        self.ensure_index()
+        self.remove_from_index(position)
+        self.add_to_index(self.history[position], position)
+        self.set_something_changed()
 
     def append(self, entry: MatingEntry):
-        if entry not in self.history:
-            entry.set_history_something_changed = self.set_something_changed # dirty!
+        self.ensure_index()
+        positions = self.index.get(mating_entry_key(entry))
+        if positions is None:
             self.history.append(entry)
             self.counts.append(1)
+            self.add_to_index(entry, len(self.history) - 1)
             res = entry
         else:
-            index = self.history.index(entry)
+            index = positions[0]
             self.counts[index] += 1
+            front_key = self.front_keys[index]
+            self.front_counts[front_key] += 1
+            self.changed_rows.add(front_key)
             res = self.history[index]
         self.something_changed = True
         return res
@@ -468,42 +807,60 @@ class MatingHistory:
     def get_history_counts(self, debug=False):
         if debug:
             return self.history, self.counts
-        front_history = []
-        front_counts = []
-        for entry, count in zip(self.history, self.counts):
-            front_entry = MatingEntry(
-                entry.parent1_dom,
-                entry.parent1_rec if entry.parent1_inspected else None,
-                entry.parent2_dom,
-                entry.parent2_rec if entry.parent2_inspected else None,
-                entry.child_dom,
-                entry.child_rec if entry.child_inspected else None,
-                entry.parent1_inspected,
-                entry.parent2_inspected,
-                entry.child_inspected,
-            )
-            if front_entry not in front_history:
-                front_history.append(front_entry)
-                front_counts.append(count)
-            else:
-                index = front_history.index(front_entry)
-                front_counts[index] += count
+        self.ensure_index()
+        front_history = [self.front_entries[front_key] for _, front_key in self.front_order]
+        front_counts = [self.front_counts[front_key] for _, front_key in self.front_order]
         return front_history, front_counts
 
+    def front_rows_count(self):
+        self.ensure_index()
+        return len(self.front_order)
+
+    def get_front_row(self, row: int) -> Tuple[MatingEntry, int]:
+        self.ensure_index()
+        front_key = self.front_order[row][1]
+        return self.front_entries[front_key], self.front_counts[front_key]
+
+    def get_changed_rows(self) -> Optional[List[int]]:
+        '''
+        Indices of the front rows that changed since the last acknowledgement,
+        None if rows were added, removed or reordered, so every index may have shifted
+        '''
+        self.ensure_index()
+        if self.rows_moved:
+            return None
+        return sorted(bisect_left(self.front_order, (self.front_members[front_key][0],))
+                      for front_key in self.changed_rows if front_key in self.front_members)
+
     def set_something_changed(self):
         self.something_changed = True
 
     def acknowledge_changes(self, debug=False):
         if not debug:
             self.something_changed = False
+            if self.index is not None:
+                self.changed_rows.clear()
+                self.rows_moved = False
 
 class Slot:
     empty_str = 'Slot empty'
+    owner : 'Inventory' = None # inventory holding the slot at `index`, told whenever the bee changes; not saved
+    index : int = None
     def __init__(self, slot=None, amount=0):
         self.slot = slot
         self.amount = amount
         super().__init__()
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('owner', None)
+        state.pop('index', None)
+        return state
+
+    def changed(self, old_bee):
+        if self.owner is not None:
+            self.owner.slot_changed(self, old_bee)
+
     def __str__(self):
         if self.slot is not None:
             return str(self.slot) + self.str_amount()
@@ -528,6 +885,7 @@ class Slot:
             if self.slot is None:
                 self.slot = bee
                 self.amount = amount
+                self.changed(None)
             else:
                 raise SlotOccupiedError('The slot is not empty')
 
@@ -537,6 +895,8 @@ class Slot:
         if self.amount <= 0:
             self.slot = None
             self.amount = 0
+            if bee is not None:
+                self.changed(bee)
         return bee
 
     def take_all(self):
@@ -544,6 +904,8 @@ class Slot:
         self.slot = None
         amt = self.amount
         self.amount = 0
+        if bee is not None:
+            self.changed(bee)
         return bee, amt
 
     def swap(self, other: 'Slot'):
@@ -568,14 +930,86 @@ class CostWatcher(type):
 
 class Building(metaclass=CostWatcher):
     all_buildings_costs = {}
+    scheduler : 'BuildingScheduler' = None # set when the game registers the building
+    runtime_attributes = ('scheduler',) # attached by the game, not saved
+
+    def ticks_until_update(self):
+        '''Ticks until the next update is needed, None to sleep until `wake` is called'''
+        return None
+
+    def wake(self):
+        if self.scheduler is not None:
+            self.scheduler.wake(self)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.runtime_attributes:
+            state.pop(name, None)
+        return state
 
 class Inventory(Building):
+    '''
+    Slots are indexed so that placing bees doesn't scan the storage:
+    `bee_slots` maps genes to the positions of the slots holding bees with
+    them and `free_slots` is a min-heap of empty positions. The slots report
+    every change of their bee, so the index stays valid when the ui moves
+    bees between slots directly.
+    '''
     cost = {ResourceTypes.WOOD: 50, ResourceTypes.FLOWERS: 50}
+    runtime_attributes = Building.runtime_attributes + ('bee_slots', 'free_slots', 'in_free_slots', 'empty_count')
     def __init__(self, capacity=None, name=''):
         super().__init__()
         self.capacity = capacity or 100
         self.storage = [Slot() for i in range(self.capacity)]
         self.name = name
+        self.reindex()
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.reindex()
+
+    def reindex(self):
+        self.bee_slots : Dict[Genes, set] = {}
+        self.free_slots : List[int] = []
+        self.in_free_slots = set()
+        self.empty_count = 0
+        for index, slot in enumerate(self.storage):
+            slot.owner = self
+            slot.index = index
+            self.index_slot(slot)
+
+    def index_slot(self, slot: Slot):
+        if slot.slot is not None:
+            self.bee_slots.setdefault(slot.slot.genes, set()).add(slot.index)
+        else:
+            self.empty_count += 1
+            if slot.index not in self.in_free_slots:
+                self.in_free_slots.add(slot.index)
+                heapq.heappush(self.free_slots, slot.index)
+
+    def unindex_bee(self, bee: Bee, index: int):
+        positions = self.bee_slots[bee.genes]
+        positions.discard(index)
+        if not positions:
+            del self.bee_slots[bee.genes]
+
+    def slot_changed(self, slot: Slot, old_bee: Bee):
+        if old_bee is not None:
+            self.unindex_bee(old_bee, slot.index)
+        else:
+            self.empty_count -= 1
+        self.index_slot(slot)
+
+    def find_stack(self, bee: Bee):
+        '''Position of the first slot holding `bee`, None if there is none'''
+        positions = [index for index in self.bee_slots.get(bee.genes, ()) if self.storage[index].slot == bee]
+        return min(positions, default=None)
+
+    def first_free_slot(self):
+        free = self.free_slots
+        while free and not self.storage[free[0]].is_empty(): # taken since it was freed
+            self.in_free_slots.discard(heapq.heappop(free))
+        return free[0] if free else None
 
     def __setitem__(self, key, value):
         self.storage[key].put(value)
@@ -607,10 +1041,21 @@ class Inventory(Building):
         return self.storage[index].take_all()
 
     def empty_slots(self):
-        return sum(el.is_empty() for el in self.storage)
+        return self.empty_count
 
     def swap(self, i1, i2):
-        self.storage[i1], self.storage[i2] = self.storage[i2], self.storage[i1]
+        slot1, slot2 = self.storage[i1], self.storage[i2]
+        if slot1 is slot2:
+            return
+        for slot in (slot1, slot2):
+            if slot.slot is not None:
+                self.unindex_bee(slot.slot, slot.index)
+            else:
+                self.empty_count -= 1
+        self.storage[i1], self.storage[i2] = slot2, slot1
+        slot1.index, slot2.index = i2, i1
+        for slot in (slot1, slot2):
+            self.index_slot(slot)
 
     def mate(self, i1, i2):
         if i1 == i2:
@@ -619,63 +1064,38 @@ class Inventory(Building):
         drone = self.storage[i2].take()
         self.storage[i1].put(princess.mate(drone))
 
-    def check_enough_space(self, list_things: Union[List[Bee], List[Slot]]):
-        not_in_storage = 0
-        for thing_index, thing in enumerate(list_things):
-            index = 0
+    def check_enough_space(self, list_things: Union[List[Bee], List[Slot], List[Tuple[Bee, int]]]):
+        not_in_storage = set() # bees that will need an empty slot, equal bees will share it
+        for thing in list_things:
             if isinstance(thing, Slot):
                 bee = thing.slot
+            elif isinstance(thing, tuple):
+                bee = thing[0]
             else:
                 bee = thing
             if bee is None:
                 continue
-            while index < self.capacity:
-                if self.storage[index].is_empty(): # this slot is empty, we are handling empty slots later
-                    index += 1
-                    continue
-                if self.storage[index].slot == bee: # this thing is already in storage
-                    break
-                else:
-                    index += 1
-            else:
-                if thing not in list_things[:thing_index]: # if thing was already seen
-                    not_in_storage += 1
-        return not_in_storage <= self.empty_slots() # return True if amt of things not found in storage less than amt of empty slots
-
+            if self.find_stack(bee) is None:
+                not_in_storage.add(bee)
+        return len(not_in_storage) <= self.empty_slots()
 
-    def place_bees(self, list_things: Union[List[Bee], List[Slot]]):
+    def place_bees(self, list_things: Union[List[Bee], List[Slot], List[Tuple[Bee, int]]]):
         if not self.check_enough_space(list_things):
             raise SlotOccupiedError('Tried to insert too many bees')
-        for thing in list_things: # try to put into occupied slots first
-            index = 0
+        for thing in list_things:
             if isinstance(thing, Slot):
                 bee, amt = thing.take_all()
-            elif isinstance(thing, Bee):
+            elif isinstance(thing, tuple):
+                bee, amt = thing
+            else:
                 bee = thing
                 amt = 1
             if bee is None:
                 continue
-            while index < self.capacity:
-                if self.storage[index].is_empty():
-                    index += 1
-                    continue
-                try:
-                    self.storage[index].put(bee, amt)
-                    index += 1
-                    break
-                except SlotOccupiedError:
-                    index += 1
-                    continue
-            else:
-                index = 0
-                while index < self.capacity:
-                    try:
-                        self.storage[index].put(bee, amt)
-                        index += 1
-                        break
-                    except SlotOccupiedError:
-                        index += 1
-                        continue
+            index = self.find_stack(bee) # try to put into occupied slots first
+            if index is None:
+                index = self.first_free_slot()
+            self.storage[index].put(bee, amt)
 
     def sort(self):
         r = []
@@ -709,6 +1129,8 @@ class ApiaryProblems(Enum):
 class Apiary(Building):
     cost = {ResourceTypes.HONEY: 100, ResourceTypes.WOOD: 50, ResourceTypes.FLOWERS: 50}
     production_modifier = 1/3
+    production : 'ProductionStage' = None # produces for the queen in bulk when set, otherwise `produce` does it every tick
+    runtime_attributes = Building.runtime_attributes + ('production',)
     def __init__(self, name, add_resources, add_mating_entry, bestiary: Bestiary):
         super().__init__()
         self.inv = Inventory(7)
@@ -742,6 +1164,7 @@ class Apiary(Building):
         self.try_breed()
 
     def take_princess(self):
+        self.wake()
         return self.princess.take_all()
 
     def put_drone(self, bee, amount=1):
@@ -761,6 +1184,7 @@ class Apiary(Building):
 
     def take(self, index):
         bee, amount = self.inv.take_all(index)
+        self.wake()
         if isinstance(self.princess.slot, Queen):
             if self.princess.slot.remaining_lifespan == 0:
                 self.try_queen_die()
@@ -771,10 +1195,12 @@ class Apiary(Building):
         for i in indices:
             if not self.inv[i].is_empty():
                 res.append(self.inv[i].take_all())
+        self.wake()
         self.try_queen_die()
         return res
 
     def try_breed(self):
+        self.wake()
         if isinstance(self.princess.slot, Princess) and isinstance(self.drone.slot, Drone):
             if self.princess.amount == 1:
                 princess = self.princess.take()
@@ -816,32 +1242,60 @@ class Apiary(Building):
             queen_died = self.try_queen_die()
             if not queen_died and self.princess.slot.remaining_lifespan > 0:
                 self.problem = ApiaryProblems.ALL_OK
-                self.princess.slot.remaining_lifespan -= 1
-                res = products.get(self.princess.slot.genes.species[0])
-                if res is not None:
-                    resources_to_add = defaultdict(int)
-                    for res_name in res:
-                        amt, prob = res[res_name]
-                        probability = (self.princess.slot.genes.speed[0].value) * (self.production_modifier) * config_production_modifier * (prob)
-                        # print(self.princess.slot.genes.speed[0], prob, probability)
-                        if probability > 1:
-                            resources_to_add[res_name] = int(probability)
-                            probability -= int(probability)
-                        if random.random() < probability:
-                            resources_to_add[res_name] += 1
-                    self.add_resources(resources_to_add)
-                    self.bestiary.add_produced_resources(self.princess.slot.genes.species[0], resources_to_add)
-                else:
-                    assert False, 'Should be unreachable'
+                if self.production is not None:
+                    self.production.add(self)
+                    return
+                self.produce()
         else:
             self.problem = ApiaryProblems.NO_QUEEN
+        if self.production is not None:
+            self.production.remove(self)
+
+    def produce(self):
+        self.princess.slot.remaining_lifespan -= 1
+        res = products.get(self.princess.slot.genes.species[0])
+        if res is not None:
+            resources_to_add = defaultdict(int)
+            for res_name in res:
+                amt, prob = res[res_name]
+                probability = (self.princess.slot.genes.speed[0].value) * (self.production_modifier) * config_production_modifier * (prob)
+                # print(self.princess.slot.genes.speed[0], prob, probability)
+                if probability > 1:
+                    resources_to_add[res_name] = int(probability)
+                    probability -= int(probability)
+                if random.random() < probability:
+                    resources_to_add[res_name] += 1
+            self.add_resources(resources_to_add)
+            self.bestiary.add_produced_resources(self.princess.slot.genes.species[0], resources_to_add)
+        else:
+            assert False, 'Should be unreachable'
+
+    def ticks_until_update(self):
+        # NO_SPACE can only be resolved by taking bees out, which wakes the apiary
+        if self.problem == ApiaryProblems.NO_SPACE:
+            return None
+        if isinstance(self.princess.slot, Queen):
+            if self.production is not None and self.princess.slot.remaining_lifespan > 0:
+                return self.princess.slot.remaining_lifespan # production runs without us, wake up when she dies
+            return 1
+        if self.problem != ApiaryProblems.NO_QUEEN:
+            return 1 # once more to report NO_QUEEN
+        return None
 
 class Alveary(Apiary):
     cost = {ResourceTypes.HONEY: 1000, ResourceTypes.ROYAL_JELLY: 250, ResourceTypes.POLLEN_CLUSTER: 250}
 
 class Analyzer(Building):
+    '''
+    Consumes a bee every `time_to_analyze` + 1 ticks. It is only updated when
+    a bee is done or something wakes it, so `time_left` is counted down by
+    the ticks it slept through when it is updated; `current_time_left` has
+    the count at any tick.
+    '''
     cost = {ResourceTypes.STRING: 10, ResourceTypes.GOLD: 10}
     hide_from_buildings = True
+    updated_at = None # tick of the scheduler `time_left` was counted down to
+    runtime_attributes = Building.runtime_attributes + ('updated_at',)
     def __init__(self, name):
         super().__init__()
         self.name = name
@@ -853,7 +1307,27 @@ class Analyzer(Building):
         self.time_to_analyze = 4
         self.consumed_amount = 0
 
+    def time_left_at(self, tick: int) -> Optional[int]:
+        '''`time_left` after the update at `tick`, had the analyzer been updated every tick'''
+        if self.time_left is None or self.updated_at is None:
+            return self.time_left
+        return max(self.time_left - max(tick - self.updated_at, 0), 0)
+
+    def current_time_left(self) -> Optional[int]:
+        if self.scheduler is None:
+            return self.time_left
+        return self.time_left_at(self.scheduler.ticks - 1)
+
+    def settle(self):
+        '''Counts `time_left` down to the last tick, before the state is saved or the scheduler replaced'''
+        if self.scheduler is not None and self.updated_at is not None:
+            self.time_left = self.current_time_left()
+            self.updated_at = self.scheduler.ticks - 1
+
     def update(self):
+        if self.scheduler is not None:
+            self.time_left = self.time_left_at(self.scheduler.ticks - 1)
+            self.updated_at = self.scheduler.ticks
         if self.slot.is_empty():
             self.time_left = None
             return
@@ -878,6 +1352,14 @@ class Analyzer(Building):
         if self.consumed_amount >= self.amount_needed_to_consume:
             print(local[self.species][0])
 
+    def ticks_until_update(self):
+        if self.slot.is_empty():
+            return None if self.time_left is None else 1
+        if self.consumed_enough():
+            return None
+        if self.time_left is None:
+            return 1
+        return self.time_left + 1 # the bee is consumed by the update after the count reaches 0
 
     def put(self, bee: Bee, amount=1):
         if bee is None: return
@@ -890,16 +1372,15 @@ class Analyzer(Building):
         if self.consumed_amount == 0:
             self.set_need_to_consume(bee.genes.species[0])
         self.slot.put(bee, amount)
+        self.wake()
 
     def set_need_to_consume(self, species: BeeSpecies):
         self.species = species
         self.amount_needed_to_consume = amount_needed_to_analyze[species]
 
-        for mutation, children in mutations.items():
-            if mutation[0] == self.species and tiers[mutation[0]] >= tiers[mutation[1]]:
-                times = len(children) - 1
-                for _ in range(times):
-                    self.hints.append(mutation)
+        for other, _, _ in mutation_partners.get(self.species, []):
+            if tiers[self.species] >= tiers[other]:
+                self.hints.append((self.species, other))
         # self.hints = ['a+b', 'b+c', 'c+d']
 
     def consumed_enough(self):
@@ -913,17 +1394,183 @@ class AnalyzerString(Analyzer):
     hide_from_buildings = False
     cost = {ResourceTypes.STRING: 20}
 
+class BuildingScheduler:
+    '''
+    Updates only the buildings that have something to do: each one sits in a
+    priority queue under the tick of its next update, as reported by
+    `Building.ticks_until_update`. Sleeping buildings cost nothing per tick
+    until something calls their `wake`.
+    '''
+    def __init__(self):
+        self.ticks = 0
+        self.queue : List[Tuple[int, int, Building]] = []
+        self.scheduled : Dict[Building, int] = {} # building -> tick of its live queue entry
+        self.order = itertools.count() # keeps buildings of the same tick in registration order
+        self.lock = threading.RLock() # the ui wakes buildings while the state thread ticks
+
+    def add(self, building: Building):
+        building.scheduler = self
+        self.wake(building)
+
+    def wake(self, building: Building):
+        self.schedule(building, self.ticks)
+
+    def schedule(self, building: Building, tick: int):
+        with self.lock:
+            if self.scheduled.get(building, tick + 1) <= tick:
+                return
+            self.scheduled[building] = tick
+            heapq.heappush(self.queue, (tick, next(self.order), building))
+
+    def tick(self):
+        due = []
+        with self.lock:
+            while self.queue and self.queue[0][0] <= self.ticks:
+                tick, _, building = heapq.heappop(self.queue)
+                if self.scheduled.get(building) == tick: # otherwise the entry was superseded by an earlier one
+                    del self.scheduled[building]
+                    due.append(building)
+        for building in due:
+            building.update()
+            delay = building.ticks_until_update()
+            if delay is not None:
+                self.schedule(building, self.ticks + delay)
+        self.ticks += 1
+
+    def __len__(self):
+        return len(self.scheduled)
+
+def _production_rates():
+    '''Production probabilities per unit of speed, [species ordinal, resource]'''
+    rates = np.zeros((len(BeeSpecies), len(ResourceTypes)))
+    for species, res in products.items():
+        for res_name, (amt, prob) in res.items():
+            rates[allele_ordinals[species], res_name.value] = config_production_modifier * prob
+    return rates
+
+class ProductionStage:
+    '''
+    Production of all working apiaries, kept as struct-of-arrays: one row per
+    apiary with a living queen holding her species ordinal, her speed scaled
+    by the apiary modifier and her remaining lifespan. Products of a species
+    are precomputed as a vector over `ResourceTypes`, so a batch of ticks is
+    one binomial draw for every apiary and resource, merged into `Resources`
+    and `Bestiary` in one go.
+
+    Apiaries add themselves on update while their queen lives and remove
+    themselves once she is gone; remaining lifespans are written back to the
+    queens after every batch.
+    '''
+    rates = _production_rates()
+
+    def __init__(self, resources: Resources, bestiary: Bestiary, capacity=16, rng: Optional[np.random.Generator] = None):
+        self.resources = resources
+        self.bestiary = bestiary
+        self.rng = rng if rng is not None else np.random.default_rng(random.getrandbits(64))
+        self.apiaries : List[Apiary] = []
+        self.rows : Dict[Apiary, int] = {}
+        self.species = np.zeros(capacity, dtype=np.intp)
+        self.scale = np.zeros(capacity)
+        self.remaining = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.apiaries)
+
+    def add(self, apiary: Apiary):
+        '''Adds the apiary or refreshes its row from the queen currently inside'''
+        row = self.rows.get(apiary)
+        if row is None:
+            row = len(self.apiaries)
+            if row == len(self.species):
+                self.species = np.resize(self.species, 2 * row)
+                self.scale = np.resize(self.scale, 2 * row)
+                self.remaining = np.resize(self.remaining, 2 * row)
+            self.rows[apiary] = row
+            self.apiaries.append(apiary)
+        queen : Queen = apiary.princess.slot
+        self.species[row] = allele_ordinals[queen.genes.species[0]]
+        self.scale[row] = queen.genes.speed[0].value * apiary.production_modifier
+        self.remaining[row] = queen.remaining_lifespan
+
+    def remove(self, apiary: Apiary):
+        row = self.rows.pop(apiary, None)
+        if row is None:
+            return
+        last = len(self.apiaries) - 1
+        moved = self.apiaries.pop()
+        if row != last: # move the last row into the hole
+            self.apiaries[row] = moved
+            self.rows[moved] = row
+            self.species[row] = self.species[last]
+            self.scale[row] = self.scale[last]
+            self.remaining[row] = self.remaining[last]
+
+    def produce(self, ticks=1):
+        n = len(self.apiaries)
+        if n == 0:
+            return
+        remaining = self.remaining[:n]
+        active = np.minimum(remaining, ticks)
+        probability = self.scale[:n, None] * self.rates[self.species[:n]]
+        whole = np.floor(probability)
+        produced = whole.astype(np.int64) * active[:, None] + self.rng.binomial(active[:, None], probability - whole)
+        remaining -= active
+
+        for apiary, lifespan in zip(self.apiaries, remaining.tolist()):
+            apiary.princess.slot.remaining_lifespan = lifespan
+
+        resource_types = list(ResourceTypes)
+        total = produced.sum(axis=0)
+        self.resources.add_resources({resource_types[i]: int(total[i]) for i in np.flatnonzero(total)})
+        by_species = np.zeros((len(BeeSpecies), len(ResourceTypes)), dtype=np.int64)
+        np.add.at(by_species, self.species[:n], produced)
+        all_species = list(BeeSpecies)
+        for species, resource in zip(*np.nonzero(by_species)):
+            self.bestiary.add_produced_resources(all_species[species], {resource_types[resource]: int(by_species[species, resource])})
+
+def default_achievements() -> List[Achievement]:
+    product_achievements = [
+        ProducedProducts({ResourceTypes.FLOWERS: 10, ResourceTypes.WOOD: 10}, {ResourceTypes.HONEY: 5}, **local['produce10flowers10wood']),
+        ProducedProducts({ResourceTypes.HONEY: 1}, {ResourceTypes.HONEY: 5}, **local['produce1honey']),
+        ProducedProducts({ResourceTypes.HONEY: 50}, {ResourceTypes.POLLEN_CLUSTER: 1, ResourceTypes.ROYAL_JELLY: 1}, **local['produce50honey']),
+        ProducedProducts({ResourceTypes.POLLEN_CLUSTER: 1}, {ResourceTypes.POLLEN_CLUSTER: 5}, **local['produce1pollencluster']),
+        ProducedProducts({ResourceTypes.ROYAL_JELLY: 1}, {ResourceTypes.ROYAL_JELLY: 5}, **local['produce1royaljelly']),
+    ]
+    achievement_species = [
+        (BeeSpecies.COMMON, 'breedCOMMON'),
+        (BeeSpecies.CULTIVATED, 'breedCULTIVATED'),
+        (BeeSpecies.NOBLE, 'breedNOBLE'),
+        (BeeSpecies.MAJESTIC, 'breedMAJESTIC'),
+        (BeeSpecies.IMPERIAL, 'breedIMPERIAL'),
+        (BeeSpecies.DILIGENT, 'breedDILIGENT'),
+        (BeeSpecies.UNWEARY, 'breedUNWEARY'),
+        (BeeSpecies.INDUSTRIOUS, 'breedINDUSTRIOUS'),
+    ]
+    species_achievements = [BredSpecies(species, **local[text]) for species, text in achievement_species]
+    return product_achievements + species_achievements
+
 class Game:
     inspect_cost = 3
-    def __init__(self):
+    tick_duration = 1 # seconds of wall clock per tick in real-time mode
+    command_out = None
+    journal = None # persistence.Journal recording commands and ticks, see `start_journal`
+    autosave = None # persistence.Autosave, see `start_autosave`
+    save_compression = None # 'zlib', 'lzma' or None, used by `save` and autosaves
+    def __init__(self, real_time=True):
+        self.real_time = real_time
         self.exit_event = threading.Event()
+        self.state_lock = threading.RLock() # ticks, commands and snapshots never overlap
         self.inner_state_thread = None
         self.restart_game()
 
     def restart_game(self):
+        self.stop_journal()
+        self.ticks = 0
+        self.scheduler = BuildingScheduler()
         self.resources = Resources()
         # self.resources = Resources({ResourceTypes.WOOD: 50, ResourceTypes.FLOWERS: 50})
         self.bestiary = Bestiary()
+        self.production = ProductionStage(self.resources, self.bestiary)
         self.mating_history = MatingHistory()
         self.inventories : dict[str, Inventory] = {}
         self.build('inventory', free=True)
@@ -933,37 +1580,19 @@ class Game:
         self.analyzers: List[Analyzer] = []
         self.total_inspections = 0
 
-        product_achievements = [
-            ProducedProducts({ResourceTypes.FLOWERS: 10, ResourceTypes.WOOD: 10}, {ResourceTypes.HONEY: 5}, **local['produce10flowers10wood']),
-            ProducedProducts({ResourceTypes.HONEY: 1}, {ResourceTypes.HONEY: 5}, **local['produce1honey']),
-            ProducedProducts({ResourceTypes.HONEY: 50}, {ResourceTypes.POLLEN_CLUSTER: 1, ResourceTypes.ROYAL_JELLY: 1}, **local['produce50honey']),
-            ProducedProducts({ResourceTypes.POLLEN_CLUSTER: 1}, {ResourceTypes.POLLEN_CLUSTER: 5}, **local['produce1pollencluster']),
-            ProducedProducts({ResourceTypes.ROYAL_JELLY: 1}, {ResourceTypes.ROYAL_JELLY: 5}, **local['produce1royaljelly']),
-        ]
-        achievement_species = [
-            (BeeSpecies.COMMON, 'breedCOMMON'),
-            (BeeSpecies.CULTIVATED, 'breedCULTIVATED'),
-            (BeeSpecies.NOBLE, 'breedNOBLE'),
-            (BeeSpecies.MAJESTIC, 'breedMAJESTIC'),
-            (BeeSpecies.IMPERIAL, 'breedIMPERIAL'),
-            (BeeSpecies.DILIGENT, 'breedDILIGENT'),
-            (BeeSpecies.UNWEARY, 'breedUNWEARY'),
-            (BeeSpecies.INDUSTRIOUS, 'breedINDUSTRIOUS'),
-        ]
-        species_achievements = [BredSpecies(species, **local[text]) for species, text in achievement_species]
-        self.achievement_manager = AchievementManager(
-            self,
-            product_achievements + species_achievements,
-            self.notify_achievement
-        )
+        self.achievement_manager = AchievementManager(self, default_achievements(), self.notify_achievement)
 
         if self.inner_state_thread is not None:
             self.exit_event.set()
             self.inner_state_thread.join()
             self.inner_state_thread = None
         self.exit_event.clear()
-        self.inner_state_thread = threading.Thread(target=self.update_state)
-        self.inner_state_thread.start()
+        if self.real_time:
+            self.inner_state_thread = threading.Thread(target=self.update_state)
+            self.inner_state_thread.start()
+
+    def print(self, *strings, sep=' ', end='\n', flush=False, out=None):
+        print(*strings, sep=sep, end=end, flush=flush)
 
     def notify_achievement(self, achievement: Achievement):
         self.print(local['unlocked'] + ':\n' +
@@ -973,6 +1602,7 @@ class Game:
 
     def exit(self):  # tested
         self.exit_event.set()
+        self.stop_autosave()
         self.print('Exiting...')
 
     @staticmethod
@@ -1053,6 +1683,8 @@ class Game:
             if not free:
                 self.resources.remove_resources(Apiary.cost)
             self.apiaries.append(Apiary(str(len(self.apiaries)), self.resources.add_resources, self.mating_history.append, self.bestiary))
+            self.apiaries[-1].production = self.production
+            self.scheduler.add(self.apiaries[-1])
             return self.apiaries[-1]
         elif params[0] in ['inventory', 'inv', 'i']:
             if not free:
@@ -1069,16 +1701,19 @@ class Game:
             if not free:
                 self.resources.remove_resources(Analyzer.cost)
             self.analyzers.append(Analyzer(str(len(self.analyzers))))
+            self.scheduler.add(self.analyzers[-1])
             return self.analyzers[-1]
         elif params[0] == 'analyzergold':
             if not free:
                 self.resources.remove_resources(AnalyzerGold.cost)
             self.analyzers.append(Analyzer(str(len(self.analyzers))))
+            self.scheduler.add(self.analyzers[-1])
             return self.analyzers[-1]
         elif params[0] == 'analyzerstring':
             if not free:
                 self.resources.remove_resources(AnalyzerString.cost)
             self.analyzers.append(Analyzer(str(len(self.analyzers))))
+            self.scheduler.add(self.analyzers[-1])
             return self.analyzers[-1]
         else:
             raise ValueError('Tried to build unknown building')
@@ -1101,20 +1736,36 @@ class Game:
                 options.append((building_name, cost))
         return options
 
+    def tick(self, ticks=1):
+        '''Runs `ticks` ticks, the production of all of them is drawn at once'''
+        # nothing can put a new queen in between, so only the first tick can start production,
+        # and queens that die within the batch only produce for their remaining lifespan
+        with self.state_lock:
+            self.scheduler.tick()
+            self.production.produce(ticks)
+            for _ in range(ticks - 1):
+                self.scheduler.tick()
+
+            self.achievement_manager.check_achievements()
+            self.ticks += ticks
+            if self.journal is not None:
+                self.journal.record_ticks(ticks)
+            if self.autosave is not None:
+                self.autosave.tick(ticks)
+
+    def advance(self, ticks=1):
+        '''Runs `ticks` ticks back-to-back, independent of the wall clock'''
+        self.tick(ticks)
+        self.state_updated()
+
     def update_state(self):
+        # real-time driver: one tick per `tick_duration` seconds
         while True:
-            time.sleep(1)
+            time.sleep(self.tick_duration)
             if self.exit_event.is_set():
                 break
 
-            for apiary in self.apiaries:
-                apiary.update()
-            for analyzer in self.analyzers:
-                analyzer.update()
-
-            self.achievement_manager.check_achievements()
-
-            self.state_updated()
+            self.advance()
 
     def state_updated(self):
         pass
@@ -1122,6 +1773,8 @@ class Game:
     def get_state(self) -> dict:
         from migration import \
             CURRENT_BACK_VERSION  # import here to avoid circular imports
+        for analyzer in self.analyzers:
+            analyzer.settle()
         return {
             'back_version': CURRENT_BACK_VERSION,
             'resources': self.resources,
@@ -1129,52 +1782,128 @@ class Game:
             'apiaries': self.apiaries,
             'analyzers':self.analyzers,
             'total_inspections': self.total_inspections,
+            'ticks': self.ticks,
             'mating_history': self.mating_history,
             'bestiary': self.bestiary,
             'achievements': self.achievement_manager.achievements,
         }
 
-    def save(self, name):
+    def save(self, name, compression=None):
+        '''`compression` is 'zlib' or 'lzma', `save_compression` if not given'''
+        if self.journal is not None and self.journal.name == name:
+            with self.state_lock:
+                self.journal.compact(wait=True)
+            return
+        from persistence import binary, catalog, compressing
         if not os.path.exists('saves'):
             os.mkdir('saves')
-        with open('saves/' + name + '.forestry', 'wb') as f:
-            pickle.dump(self.get_state(), f)
+        compression = compression or self.save_compression
+        state = self.get_state()
+        with open('saves/' + name + '.forestry', 'wb') as f, compressing(f, compression) as out:
+            binary.dump(state, out)
+        catalog.record(name, catalog.describe(state, compression))
+
+    def start_journal(self, name):
+        '''Saves the game as a snapshot plus a log of commands and ticks, which is appended to from now on'''
+        from persistence import Journal
+        with self.state_lock:
+            self.stop_journal()
+            self.journal = Journal(self, name)
+            self.journal.compact(wait=True)
+
+    def start_autosave(self, interval=300, slots=3):
+        '''Saves every `interval` ticks into `slots` rotating saves, written in the background'''
+        from persistence import Autosave
+        self.stop_autosave()
+        self.autosave = Autosave(self, interval, slots)
+
+    def stop_autosave(self):
+        if self.autosave is not None:
+            self.autosave.stop()
+            self.autosave = None
+
+    def stop_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
 
     def get_save_names_list(self):
-        if not os.path.exists('saves'):
-            return []
-        return [x.replace('.forestry', '') for x in os.listdir('saves') if x.endswith('.forestry')]
+        from persistence import catalog
+        return list(catalog.entries())
 
     def load_last(self):
-        d = {name: os.path.getmtime('saves/' + name + '.forestry') for name in self.get_save_names_list()}
-        if len(d) == 0:
+        from persistence import catalog
+        saves = catalog.entries()
+        if len(saves) == 0:
             return
-        latest = max(d, key=d.get)
+        latest = max(saves, key=lambda name: saves[name]['mtime'])
         self.load(latest)
 
     def load(self, name) -> dict:
+        with self.state_lock:
+            self.stop_journal()
+            state = self.load_snapshot(name)
+            if 'journal_generation' in state:
+                from persistence import Journal, replay_journal
+                generation = replay_journal(self, name, state)
+                self.journal = Journal(self, name, generation=generation)
+                self.journal.compact(wait=True)
+            return state
+
+    def load_snapshot(self, name) -> dict:
         logging.info(f'load save name {name}')
-        with open('saves/' + name + '.forestry', 'rb') as f:
-            state : dict = pickle.load(f)
-
-        from migration import (  # import here to avoid circular imports
-            CURRENT_BACK_VERSION, update_back_versions)
+        from migration import migrate  # import here to avoid circular imports
+        from persistence import binary, decompressing, migration_cache
+        path = 'saves/' + name + '.forestry'
+        with open(path, 'rb') as f:
+            source = f.read()
+        state = migration_cache.load(path, source)
+        if state is None:
+            with decompressing(io.BufferedReader(io.BytesIO(source))) as f:
+                if binary.is_binary_save(f.peek(len(binary.MAGIC))):
+                    state : dict = binary.load(f)
+                else: # saves made before the binary format
+                    state : dict = binary.load_pickled(f)
 
         try:
-            if state.get('back_version', 0) < CURRENT_BACK_VERSION:
-                for update_back_func in update_back_versions[state.get('back_version', 0):]:
-                    state = update_back_func(state)
+            state, timings = migrate(state)
+            if timings:
+                logging.info(f'migrated {name} in {sum(seconds for _, seconds in timings):.3f}s')
+                if 'journal_generation' not in state: # journals write a current snapshot right away
+                    migration_cache.store(path, source, state)
         except Exception as e:
             self.exit()
             print_exc()
 
+        self.set_state(state)
+        return state
+
+    def set_state(self, state: dict):
+        '''Takes over a current state like the one `get_state` returns'''
         self.resources = state['resources']
         self.inventories = state['inventories']
+        self.inv = next(iter(self.inventories.values()))
         self.apiaries = state['apiaries']
         self.analyzers = state.get('analyzers', [])
         self.total_inspections = state['total_inspections']
+        self.ticks = state.get('ticks', 0)
         self.mating_history = state['mating_history']
         self.bestiary = state['bestiary']
         if 'achievements' in state:
-            self.achievement_manager.achievements = state['achievements']
-        return state
\ No newline at end of file
+            self.achievement_manager.set_achievements(state['achievements'])
+        self.achievement_manager.attach(self.bestiary)
+        self.production = None
+        self.attach_buildings()
+
+    def attach_buildings(self):
+        '''Schedules all buildings from scratch, keeps the random generator of the production'''
+        rng = self.production.rng if self.production is not None else None
+        for analyzer in self.analyzers:
+            analyzer.settle()
+            analyzer.updated_at = None # ticks of the old scheduler
+        self.scheduler = BuildingScheduler()
+        self.production = ProductionStage(self.resources, self.bestiary, rng=rng)
+        for apiary in self.apiaries:
+            apiary.production = self.production
+        for building in self.apiaries + self.analyzers:
+            self.scheduler.add(building)
\ No newline at end of file
@@ -48,34 +48,55 @@ def main():
             time_delta = clock.tick(60)/1000.0
             # state = game.get_state()
 
-            for event in pygame.event.get():
-                if event.type == pygame_gui.UI_BUTTON_START_PRESS:
-                    sounds['click_start'].play()
-                elif event.type == pygame_gui.UI_BUTTON_PRESSED:
-                    sounds['click_end'].play()
-                elif event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_SPACE and pygame.key.get_mods() & pygame.KMOD_ALT:
-                        visual_debug = not visual_debug
-                        manager.set_visual_debug_mode(visual_debug)
-                elif event.type == APPLY_VOLUME_CHANGE:
-                    for key in ['click_start', 'click_end']:
-                        sounds[key].set_volume(event.settings['master_volume'] * event.settings['click_volume'])
-                elif event.type == pygame.QUIT:
-                    is_running = False
-                elif event.type == pygame.WINDOWSIZECHANGED:
-                    if event.window is None:
-                        manager.set_window_resolution((event.x, event.y))
-                        cursor_manager.set_window_resolution((event.x, event.y))
-                        background = pygame.Surface((event.x, event.y))
-                        background.fill(pygame.Color('#000000'))
+            # the ui changes the game while handling events, the state thread and autosaves wait for it
+            with game.state_lock:
+                for event in pygame.event.get():
+                    if event.type == pygame_gui.UI_BUTTON_START_PRESS:
+                        sounds['click_start'].play()
+                    elif event.type == pygame_gui.UI_BUTTON_PRESSED:
+                        sounds['click_end'].play()
+                    elif event.type == pygame.KEYDOWN:
+                        if event.key == pygame.K_SPACE and pygame.key.get_mods() & pygame.KMOD_ALT:
+                            visual_debug = not visual_debug
+                            manager.set_visual_debug_mode(visual_debug)
+                    elif event.type == APPLY_VOLUME_CHANGE:
+                        for key in ['click_start', 'click_end']:
+                            sounds[key].set_volume(event.settings['master_volume'] * event.settings['click_volume'])
+                    elif event.type == pygame.QUIT:
+                        is_running = False
+                    elif event.type == pygame.WINDOWSIZECHANGED:
+                        if event.window is None:
+                            manager.set_window_resolution((event.x, event.y))
+                            cursor_manager.set_window_resolution((event.x, event.y))
+                            background = pygame.Surface((event.x, event.y))
+                            background.fill(pygame.Color('#000000'))
+                            if game is not None:
+                                game.set_dimensions((event.x, event.y))
+                    try:
                         if game is not None:
-                            game.set_dimensions((event.x, event.y))
+                            game.process_event(event)
+                        consumed = cursor_manager.process_events(event)
+                        if not consumed:
+                            manager.process_events(event)
+                    except NotEnoughResourcesError as e:
+                        if game is not None:
+                            game.print(e, out=1, floating_text_box_time=5)
+                            print_exc()
+                        else:
+                            print(e)
+                            print_exc()
+                    except Exception as e:
+                        if game is not None:
+                            game.print(e, out=1)
+                            print_exc()
+                        else:
+                            print(e)
+                            print_exc()
                 try:
+                    manager.update(time_delta)
+                    cursor_manager.update(time_delta)
                     if game is not None:
-                        game.process_event(event)
-                    consumed = cursor_manager.process_events(event)
-                    if not consumed:
-                        manager.process_events(event)
+                        game.update(time_delta)
                 except NotEnoughResourcesError as e:
                     if game is not None:
                         game.print(e, out=1, floating_text_box_time=5)
@@ -90,25 +111,6 @@ def main():
                     else:
                         print(e)
                         print_exc()
-            try:
-                manager.update(time_delta)
-                cursor_manager.update(time_delta)
-                if game is not None:
-                    game.update(time_delta)
-            except NotEnoughResourcesError as e:
-                if game is not None:
-                    game.print(e, out=1, floating_text_box_time=5)
-                    print_exc()
-                else:
-                    print(e)
-                    print_exc()
-            except Exception as e:
-                if game is not None:
-                    game.print(e, out=1)
-                    print_exc()
-                else:
-                    print(e)
-                    print_exc()
 
             window_surface.blit(background, (0, 0))
             manager.draw_ui(window_surface)
@@ -1,2 +1,33 @@
+import logging
+import time
+from typing import List, Tuple
+
 from .front import CURRENT_FRONT_VERSION, update_front_versions
-from .back import CURRENT_BACK_VERSION, update_back_versions
\ No newline at end of file
+from .back import CURRENT_BACK_VERSION, update_back_versions
+
+
+def is_front_state(state: dict) -> bool:
+    '''The state was saved by the gui and has its windows and tutorial stage'''
+    return any(key in state for key in ('front_version', 'inspect_slot', 'inspect_windows'))
+
+
+def migrate(state: dict) -> Tuple[dict, List[Tuple[str, float]]]:
+    '''
+    Brings a loaded state to the current versions, the front too if the gui
+    saved it. Returns the state and the seconds every step took, nothing if
+    it was current already.
+    '''
+    steps = list(update_back_versions[state.get('back_version', 0):CURRENT_BACK_VERSION])
+    if is_front_state(state):
+        steps += update_front_versions[state.get('front_version', 0):CURRENT_FRONT_VERSION]
+    timings = []
+    for step in steps:
+        start = time.perf_counter()
+        state = step(state)
+        timings.append((step.__name__, time.perf_counter() - start))
+        logging.info(f'migration {step.__name__} took {timings[-1][1]:.3f}s')
+    if timings:
+        state['back_version'] = CURRENT_BACK_VERSION
+        if is_front_state(state):
+            state['front_version'] = CURRENT_FRONT_VERSION
+    return state, timings
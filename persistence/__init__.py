@@ -0,0 +1,5 @@
+from .autosave import Autosave
+from .binary import SaveFormatError, convert_save
+from .compression import compressing, decompressing
+from .files import atomic_open, atomic_write
+from .journal import Journal, replay_journal
@@ -0,0 +1,95 @@
+'''
+Autosaves that never make the game wait for the disk.
+
+Every `interval` ticks the game calls `Autosave.tick` at the end of a tick,
+under `Game.state_lock`, and the state is captured there into plain columns
+(see `binary.capture`), so the snapshot is consistent and shares nothing with
+the running game. A worker thread writes it to the next of `slots` rotating
+saves named `autosave 1`, `autosave 2`, ... and fsyncs it before replacing
+the old file. If the worker is still busy when the next snapshot is taken,
+the newer one replaces the one waiting. Autosaves are compressed with the
+game's `save_compression` and recorded in the catalog once written.
+'''
+import logging
+import os
+import threading
+
+from . import binary, catalog
+from .compression import compressing
+from .files import atomic_open
+
+
+class Autosave:
+    def __init__(self, game, interval=300, slots=3, name='autosave', directory='saves'):
+        self.game = game
+        self.interval = interval # ticks between autosaves
+        self.slots = slots
+        self.name = name
+        self.directory = directory
+        self.ticks = 0
+        self.next_slot = self.oldest_slot()
+
+        self.pending = None # snapshot waiting for the worker
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.worker = threading.Thread(target=self.run)
+        self.worker.start()
+
+    def slot_name(self, slot: int) -> str:
+        return f'{self.name} {slot + 1}'
+
+    def slot_path(self, slot: int) -> str:
+        return os.path.join(self.directory, self.slot_name(slot) + '.forestry')
+
+    def oldest_slot(self) -> int:
+        '''Continue the rotation after restarts: an unused slot or the one written longest ago'''
+        def age(slot):
+            path = self.slot_path(slot)
+            return os.path.getmtime(path) if os.path.exists(path) else float('-inf')
+        return min(range(self.slots), key=age)
+
+    def tick(self, ticks=1):
+        '''Called by the game at a tick boundary, under `Game.state_lock`'''
+        self.ticks += ticks
+        if self.ticks >= self.interval:
+            self.ticks = 0
+            self.capture()
+
+    def capture(self):
+        state = self.game.get_state()
+        compression = self.game.save_compression
+        snapshot = (binary.capture(state), catalog.describe(state, compression), compression)
+        with self.lock:
+            self.pending = snapshot
+        self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            with self.lock:
+                self.wakeup.clear()
+                snapshot, self.pending = self.pending, None
+                stopped = self.stopped
+            if snapshot is not None:
+                try:
+                    self.write(snapshot)
+                except OSError:
+                    logging.exception('autosave failed')
+            if stopped:
+                return
+
+    def write(self, snapshot):
+        tables, description, compression = snapshot
+        os.makedirs(self.directory, exist_ok=True)
+        with atomic_open(self.slot_path(self.next_slot)) as f, compressing(f, compression) as out:
+            binary.write(tables, out)
+        catalog.record(self.slot_name(self.next_slot), description, self.directory)
+        logging.info(f'autosaved to {self.slot_name(self.next_slot)}')
+        self.next_slot = (self.next_slot + 1) % self.slots
+
+    def stop(self):
+        '''Lets the worker finish the snapshot it has and exit, doesn't wait for it'''
+        with self.lock:
+            self.stopped = True
+        self.wakeup.set()
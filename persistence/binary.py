@@ -0,0 +1,766 @@
+'''
+Binary save format: the game state as a handful of flat tables instead of a
+pickle of live objects, so loading is a few bulk array reads and loading a
+save from someone else can't run code. Saves pickled before this format are
+still read by `load_pickled`, which refuses anything but the classes such
+saves contain.
+
+Layout, all integers little-endian:
+
+    b'FORESTRY', u16 format version
+    u16 number of tables, then for every table its name and columns (name, type)
+    for every table: u32 rows, then every column as one block
+
+Strings are u16 length + utf-8 in the header. Column types are `array`
+typecodes, '8s' for packed genomes (see `Genes.packed`) and 's' for strings,
+stored as an 'I' array of byte lengths followed by the utf-8 blob. `SCHEMA`
+declares what the current version writes; the reader goes by the columns
+declared in the file, skips tables and columns it doesn't know, fills
+columns added later from `DEFAULTS`, tables added later in `ADDED_TABLES`
+as empty and fails with `SaveFormatError` when any other column it needs is
+missing.
+
+Objects referenced from several places are written once and referred to by
+row: bees (queens point at their parents and children), slots and entries of
+the mating history, which bees point at through `Bee.mating_entries`.
+Alleles are stored as ordinals together with the allele names the save was
+made with, so saves survive reordering of the config.
+'''
+import gc
+import io
+import json
+import pickle
+import sys
+from array import array
+from collections import defaultdict
+from enum import Enum
+from typing import Dict, List
+
+import numpy as np
+
+from config import BeeSpecies, ResourceTypes, allele_ordinals, genes_enums
+from forestry import (Alveary, Analyzer, AnalyzerGold, AnalyzerString, Apiary,
+                      ApiaryProblems, Bee, Bestiary, Drone, Genes,
+                      Inventory, MatingEntry, MatingHistory, Princess, Queen,
+                      Resources, Slot, default_achievements)
+
+MAGIC = b'FORESTRY'
+FORMAT_VERSION = 1
+
+NONE = -1 # missing row, allele or number
+ROWS = '#rows' # row count of a table read from a file, next to its columns
+
+# columns added after the format was released, files without them read as these values
+DEFAULTS = {('game', 'ticks'): 0}
+# tables added after the format was released, files without them read as empty
+ADDED_TABLES = {'journal'}
+
+SCHEMA = {
+    'alleles': (('gene', 's'), ('allele', 's')), # in ordinal order of every gene at the time of saving
+    'game': (('back_version', 'H'), ('front_version', 'h'), ('total_inspections', 'q'),
+             ('tutorial_stage', 'h'), ('apiary_list_opened', 'B'), ('cursor_slot', 'i'),
+             ('history_changed', 'B'), ('ticks', 'q')),
+    'resources': (('resource', 's'), ('amount', 'q')),
+    'bees': (('kind', 'B'), ('genes', '8s'), ('inspected', 'B'), ('generation', 'i'),
+             ('parent1', 'i'), ('parent2', 'i'), ('lifespan', 'i'), ('remaining_lifespan', 'i'),
+             ('children_start', 'i'), ('children_count', 'I'), ('entries_start', 'I'), ('entries_count', 'I')),
+    'bee_children': (('bee', 'I'),),
+    'bee_entries': (('entry', 'I'), ('role', 'B')),
+    'slots': (('bee', 'i'), ('amount', 'I')),
+    'inventories': (('key', 's'), ('name', 's'), ('in_game', 'B'), ('slots_start', 'I'), ('slots_count', 'I')),
+    'apiaries': (('building', 's'), ('name', 's'), ('problem', 's'), ('princess', 'I'), ('drone', 'I'), ('inventory', 'I')),
+    'analyzers': (('building', 's'), ('name', 's'), ('slot', 'I'), ('time_left', 'i'), ('amount_needed_to_consume', 'i'),
+                  ('species', 'h'), ('time_to_analyze', 'i'), ('consumed_amount', 'i'), ('hints_start', 'I'), ('hints_count', 'I')),
+    'analyzer_hints': (('species', 'H'), ('other', 'H')),
+    'mating_history': (('parent1_dom', 'h'), ('parent1_rec', 'h'), ('parent2_dom', 'h'), ('parent2_rec', 'h'),
+                       ('child_dom', 'h'), ('child_rec', 'h'), ('parent1_inspected', 'B'), ('parent2_inspected', 'B'),
+                       ('child_inspected', 'B'), ('count', 'I')),
+    'bestiary_produced': (('species', 'H'), ('resource', 's'), ('amount', 'q')),
+    'bestiary_bred': (('species', 'H'), ('amount', 'q')),
+    'achievements': (('achieved', 'B'),),
+    'windows': (('kind', 'B'), ('target', 'i'), ('x', 'i'), ('y', 'i'), ('w', 'i'), ('h', 'i')),
+    'to_render': (('kind', 'B'), ('target', 'i')),
+    # one row in snapshots of a journal, the random generator states are json
+    'journal': (('generation', 'q'), ('random_state', 's'), ('production_rng_state', 's')),
+}
+
+BEE_KINDS = (Princess, Drone, Queen)
+ENTRY_ROLES = ('set_parent1_inspected', 'set_parent2_inspected', 'set_child_inspected')
+APIARY_BUILDINGS = {cls.__name__: cls for cls in (Apiary, Alveary)}
+ANALYZER_BUILDINGS = {cls.__name__: cls for cls in (Analyzer, AnalyzerGold, AnalyzerString)}
+INSPECT_WINDOW, APIARY_WINDOW, INVENTORY_WINDOW, ANALYZER_WINDOW = range(4)
+RENDER_RESOURCES, RENDER_INVENTORY, RENDER_APIARY, RENDER_SLOT = range(4)
+
+_GENES_SIZE = 2 * len(Genes.fields)
+_SWAP = sys.byteorder == 'big'
+
+
+class SaveFormatError(ValueError):
+    pass
+
+
+def is_binary_save(head: bytes) -> bool:
+    return head.startswith(MAGIC)
+
+
+def _ordinal(allele) -> int:
+    return NONE if allele is None else allele_ordinals[allele]
+
+
+class _TableWriter:
+    '''Collects the state into columns, shared objects get one row each'''
+    def __init__(self):
+        self.tables = {name: {column: [] for column, _ in columns} for name, columns in SCHEMA.items()}
+        self.bees: Dict[int, int] = {} # id(bee) -> row
+        self.slots: Dict[int, int] = {} # id(slot) -> row
+        self.entries: Dict[int, int] = {} # id(entry) -> position in the history
+        self.keep_alive = [] # ids are only unique while the objects live
+
+    def add_row(self, table, **values):
+        columns = self.tables[table]
+        for column, values_list in columns.items():
+            values_list.append(values[column])
+        return len(columns[next(iter(columns))]) - 1
+
+    def bee(self, bee: Bee) -> int:
+        if bee is None:
+            return NONE
+        row = self.bees.get(id(bee))
+        if row is not None:
+            return row
+        bees = self.tables['bees']
+        row = self.add_row('bees', kind=BEE_KINDS.index(type(bee)), genes=bee.genes.packed, inspected=int(bee.inspected),
+                           generation=getattr(bee, 'generation', NONE), parent1=NONE, parent2=NONE, lifespan=NONE,
+                           remaining_lifespan=NONE, children_start=NONE, children_count=0, entries_start=0, entries_count=0)
+        self.bees[id(bee)] = row
+        self.keep_alive.append(bee)
+
+        if isinstance(bee, Queen):
+            bees['parent1'][row] = self.bee(bee.parent1)
+            bees['parent2'][row] = self.bee(bee.parent2)
+            bees['lifespan'][row] = bee.lifespan
+            bees['remaining_lifespan'][row] = bee.remaining_lifespan
+            if bee.children is not None:
+                children = [self.bee(child) for child in bee.children]
+                bees['children_start'][row] = len(self.tables['bee_children']['bee'])
+                bees['children_count'][row] = len(children)
+                self.tables['bee_children']['bee'].extend(children)
+
+        entries = [(self.entries[id(method.__self__)], ENTRY_ROLES.index(method.__name__))
+                   for method in bee.mating_entries
+                   if getattr(method, '__name__', None) in ENTRY_ROLES and id(getattr(method, '__self__', None)) in self.entries]
+        bees['entries_start'][row] = len(self.tables['bee_entries']['entry'])
+        bees['entries_count'][row] = len(entries)
+        for entry, role in entries:
+            self.add_row('bee_entries', entry=entry, role=role)
+        return row
+
+    def slot(self, slot: Slot) -> int:
+        row = self.slots.get(id(slot))
+        if row is None:
+            row = self.add_row('slots', bee=self.bee(slot.slot), amount=slot.amount)
+            self.slots[id(slot)] = row
+            self.keep_alive.append(slot)
+        return row
+
+    def inventory(self, key: str, inventory: Inventory, in_game: bool) -> int:
+        '''The slots of an inventory take consecutive rows'''
+        slots_start = len(self.tables['slots']['bee'])
+        for slot in inventory.storage:
+            self.slots.setdefault(id(slot), self.add_row('slots', bee=self.bee(slot.slot), amount=slot.amount))
+            self.keep_alive.append(slot)
+        return self.add_row('inventories', key=key, name=inventory.name, in_game=int(in_game),
+                            slots_start=slots_start, slots_count=len(inventory.storage))
+
+
+def _write_state(state: dict) -> _TableWriter:
+    w = _TableWriter()
+    for gene_name, gene_enum in genes_enums.items():
+        for allele in gene_enum:
+            w.add_row('alleles', gene=gene_name, allele=allele.name)
+
+    history: MatingHistory = state['mating_history']
+    for position, entry in enumerate(history.history):
+        w.entries[id(entry)] = position
+        w.add_row('mating_history',
+                  parent1_dom=_ordinal(entry.parent1_dom), parent1_rec=_ordinal(entry.parent1_rec),
+                  parent2_dom=_ordinal(entry.parent2_dom), parent2_rec=_ordinal(entry.parent2_rec),
+                  child_dom=_ordinal(entry.child_dom), child_rec=_ordinal(entry.child_rec),
+                  parent1_inspected=int(entry.parent1_inspected), parent2_inspected=int(entry.parent2_inspected),
+                  child_inspected=int(entry.child_inspected), count=history.counts[position])
+
+    for resource, amount in state['resources'].items():
+        w.add_row('resources', resource=resource.name, amount=amount)
+
+    # an inventory's slots are added together, so they occupy consecutive rows
+    inventory_rows = {}
+    for key, inventory in state['inventories'].items():
+        inventory_rows[id(inventory)] = w.inventory(key, inventory, True)
+    for apiary in state['apiaries']:
+        inventory = w.inventory(apiary.inv.name, apiary.inv, False)
+        inventory_rows[id(apiary.inv)] = inventory
+        w.add_row('apiaries', building=type(apiary).__name__, name=apiary.name, problem=apiary.problem.name,
+                  princess=w.slot(apiary.princess), drone=w.slot(apiary.drone), inventory=inventory)
+    for analyzer in state['analyzers']:
+        hints_start = len(w.tables['analyzer_hints']['species'])
+        for species, other in analyzer.hints:
+            w.add_row('analyzer_hints', species=_ordinal(species), other=_ordinal(other))
+        w.add_row('analyzers', building=type(analyzer).__name__, name=analyzer.name, slot=w.slot(analyzer.slot),
+                  time_left=_number(analyzer.time_left), amount_needed_to_consume=_number(analyzer.amount_needed_to_consume),
+                  species=_ordinal(analyzer.species), time_to_analyze=analyzer.time_to_analyze,
+                  consumed_amount=analyzer.consumed_amount, hints_start=hints_start, hints_count=len(analyzer.hints))
+
+    bestiary: Bestiary = state['bestiary']
+    for species, resources in bestiary.produced_resources.items():
+        for resource, amount in resources.items():
+            w.add_row('bestiary_produced', species=_ordinal(species), resource=resource.name, amount=amount)
+    for species, amount in bestiary.known_bees.items():
+        w.add_row('bestiary_bred', species=_ordinal(species), amount=amount)
+    for achievement in state.get('achievements', []):
+        w.add_row('achievements', achieved=int(achievement.achieved))
+
+    # front of the gui and the console
+    front = 'front_version' in state
+    if front:
+        for rect, slot in zip(state['inspect_windows'], state['inspect_slots']):
+            w.add_row('windows', kind=INSPECT_WINDOW, target=w.slot(slot), **_rect(rect))
+        apiary_rows = {id(apiary): row for row, apiary in enumerate(state['apiaries'])}
+        for apiary, rect in state['apiary_windows']:
+            w.add_row('windows', kind=APIARY_WINDOW, target=apiary_rows[id(apiary)], **_rect(rect))
+        inventory_keys = list(state['inventories'])
+        for name, rect in state['inventory_windows']:
+            w.add_row('windows', kind=INVENTORY_WINDOW, target=inventory_keys.index(name), **_rect(rect))
+        for rect in state.get('analyzer_windows', []):
+            w.add_row('windows', kind=ANALYZER_WINDOW, target=NONE, **_rect(rect))
+    for thing in state.get('to_render', []):
+        if isinstance(thing, Resources):
+            w.add_row('to_render', kind=RENDER_RESOURCES, target=NONE)
+        elif isinstance(thing, Inventory) and id(thing) in inventory_rows:
+            w.add_row('to_render', kind=RENDER_INVENTORY, target=inventory_rows[id(thing)])
+        elif isinstance(thing, Apiary) and thing in state['apiaries']:
+            w.add_row('to_render', kind=RENDER_APIARY, target=state['apiaries'].index(thing))
+        elif isinstance(thing, Slot):
+            w.add_row('to_render', kind=RENDER_SLOT, target=w.slot(thing))
+
+    if 'journal_generation' in state:
+        w.add_row('journal', generation=state['journal_generation'], random_state=json.dumps(state['random_state']),
+                  production_rng_state=json.dumps(state['production_rng_state']))
+
+    w.add_row('game', back_version=state['back_version'], front_version=state.get('front_version', NONE),
+              total_inspections=state['total_inspections'],
+              tutorial_stage=int(state['current_tutorial_stage']) if front else NONE,
+              apiary_list_opened=int(state['apiary_list_opened']) if front else 0,
+              cursor_slot=w.slot(state['cursor_slot']) if front and state['cursor_slot'] is not None else NONE,
+              history_changed=int(history.something_changed), ticks=state.get('ticks', 0))
+    return w
+
+
+def _number(value) -> int:
+    return NONE if value is None else value
+
+
+def _rect(rect) -> dict:
+    x, y, w, h = rect
+    return {'x': x, 'y': y, 'w': w, 'h': h}
+
+
+def _pack_string(value: str) -> bytes:
+    data = value.encode('utf-8')
+    return len(data).to_bytes(2, 'little') + data
+
+
+def _column_bytes(values: list, typecode: str) -> bytes:
+    if typecode == '8s':
+        return b''.join(values)
+    if typecode == 's':
+        blobs = [value.encode('utf-8') for value in values]
+        lengths = array('I', map(len, blobs))
+        if _SWAP:
+            lengths.byteswap()
+        return lengths.tobytes() + b''.join(blobs)
+    data = array(typecode, values)
+    if _SWAP:
+        data.byteswap()
+    return data.tobytes()
+
+
+def capture(state: dict) -> Dict[str, Dict[str, list]]:
+    '''
+    Copies the state as returned by `Game.get_state` into plain columns that
+    hold no references to the game, so they can be written later on another
+    thread while the game goes on
+    '''
+    return _write_state(state).tables
+
+
+def write(tables: Dict[str, Dict[str, list]], f):
+    '''Writes columns made by `capture` into the binary file `f`'''
+    f.write(MAGIC + FORMAT_VERSION.to_bytes(2, 'little'))
+    f.write(len(SCHEMA).to_bytes(2, 'little'))
+    for table, columns in SCHEMA.items():
+        f.write(_pack_string(table) + len(columns).to_bytes(2, 'little'))
+        for column, typecode in columns:
+            f.write(_pack_string(column) + _pack_string(typecode))
+    for table, columns in SCHEMA.items():
+        values = tables[table]
+        f.write(len(values[columns[0][0]]).to_bytes(4, 'little'))
+        for column, typecode in columns:
+            f.write(_column_bytes(values[column], typecode))
+
+
+def dump(state: dict, f):
+    '''Writes the state as returned by `Game.get_state` into the binary file `f`'''
+    write(capture(state), f)
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        self.position = 0
+
+    def read(self, size: int) -> memoryview:
+        if size < 0 or self.position + size > len(self.data):
+            raise SaveFormatError('The save file is truncated')
+        chunk = self.data[self.position:self.position + size]
+        self.position += size
+        return chunk
+
+    def int(self, size: int) -> int:
+        return int.from_bytes(self.read(size), 'little')
+
+    def string(self) -> str:
+        return self.read_utf8(self.int(2))
+
+    def read_utf8(self, size: int) -> str:
+        try:
+            return str(self.read(size), 'utf-8')
+        except UnicodeDecodeError:
+            raise SaveFormatError('The save file holds a broken string')
+
+    def column(self, rows: int, typecode: str):
+        if typecode == '8s':
+            return bytes(self.read(rows * _GENES_SIZE))
+        if typecode == 's':
+            lengths = self.column(rows, 'I')
+            return [self.read_utf8(length) for length in lengths]
+        try:
+            data = array(typecode)
+        except (ValueError, TypeError):
+            raise SaveFormatError(f'Unknown column type {typecode!r}')
+        data.frombytes(self.read(rows * data.itemsize))
+        if _SWAP:
+            data.byteswap()
+        return data
+
+
+def _read_tables(data: bytes) -> Dict[str, Dict[str, object]]:
+    r = _Reader(data)
+    if bytes(r.read(len(MAGIC))) != MAGIC:
+        raise SaveFormatError('Not a binary save')
+    version = r.int(2)
+    if version > FORMAT_VERSION:
+        raise SaveFormatError(f'The save was made by a newer version of the game (format {version})')
+    declared = []
+    for _ in range(r.int(2)):
+        table = r.string()
+        declared.append((table, [(r.string(), r.string()) for _ in range(r.int(2))]))
+    tables = {}
+    for table, columns in declared:
+        rows = r.int(4)
+        tables[table] = {column: r.column(rows, typecode) for column, typecode in columns}
+        tables[table][ROWS] = rows
+    for table, columns in SCHEMA.items():
+        if table in ADDED_TABLES and table not in tables:
+            tables[table] = {column: [] for column, _ in columns}
+            tables[table][ROWS] = 0
+        for column, _ in columns:
+            if column in tables.get(table, {}):
+                continue
+            if (table, column) in DEFAULTS and table in tables:
+                tables[table][column] = [DEFAULTS[table, column]] * tables[table][ROWS]
+            else:
+                raise SaveFormatError(f'The save has no column {table}.{column}')
+    return tables
+
+
+class _StateBuilder:
+    def __init__(self, tables):
+        self.tables = tables
+        self.alleles = self.allele_maps()
+
+    def allele_maps(self) -> Dict[str, List]:
+        '''gene name -> alleles by the ordinals of the save'''
+        alleles = {gene_name: [] for gene_name in genes_enums}
+        table = self.tables['alleles']
+        for gene_name, allele_name in zip(table['gene'], table['allele']):
+            try:
+                alleles[gene_name].append(genes_enums[gene_name][allele_name])
+            except KeyError:
+                raise SaveFormatError(f'Unknown allele {gene_name}.{allele_name}')
+        return alleles
+
+    def species(self, ordinal: int):
+        if ordinal == NONE:
+            return None
+        try:
+            return self.alleles['BeeSpecies'][ordinal]
+        except IndexError:
+            raise SaveFormatError(f'Unknown species {ordinal}')
+
+    def genes_decoder(self):
+        '''Packed genomes of the save -> Genes, the bytes are kept when the allele order didn't change'''
+        tables = []
+        identity = True
+        for gene_name, alleles in self.alleles.items():
+            table = bytearray(range(256))
+            for ordinal, allele in enumerate(alleles):
+                table[ordinal] = allele_ordinals[allele]
+                identity = identity and ordinal == allele_ordinals[allele]
+            tables.append(bytes(table))
+        cache = {}
+        def decode(packed: bytes) -> Genes:
+            genes = cache.get(packed)
+            if genes is None:
+                remapped = packed
+                if not identity:
+                    remapped = bytes(tables[i // 2][b] for i, b in enumerate(packed))
+                genes = cache[packed] = Genes.from_packed(remapped)
+            return genes
+        return decode
+
+    def build(self) -> dict:
+        t = self.tables
+        game = t['game']
+        if game[ROWS] != 1:
+            raise SaveFormatError('The save must hold exactly one game')
+
+        history = MatingHistory.__new__(MatingHistory)
+        h = t['mating_history']
+        species = self.alleles['BeeSpecies'] + [None] # NONE picks the last one
+        columns = [h[column] for column in ('parent1_dom', 'parent1_rec', 'parent2_dom', 'parent2_rec', 'child_dom', 'child_rec')]
+        for column in columns:
+            _check_rows(column, len(species) - 1, 'species', allow_none=True)
+        columns = [map(species.__getitem__, column) for column in columns]
+        columns += [map(bool, h[column]) for column in ('parent1_inspected', 'parent2_inspected', 'child_inspected')]
+        history.history = list(map(MatingEntry, *columns))
+        history.counts = array('L', h['count'])
+        history.something_changed = bool(game['history_changed'][0])
+        history.index = None # built when first needed, like after unpickling
+        history.bind_entries()
+
+        bees = self.build_bees(history.history)
+        slots = self.build_slots(bees)
+        resources = Resources()
+        for name, amount in zip(t['resources']['resource'], t['resources']['amount']):
+            resources.res[self.resource(name)] = amount
+        bestiary = self.build_bestiary()
+
+        inventory_rows = []
+        inventories = {}
+        inv = t['inventories']
+        for key, name, in_game, start, count in zip(inv['key'], inv['name'], inv['in_game'], inv['slots_start'], inv['slots_count']):
+            inventory = Inventory.__new__(Inventory)
+            inventory.__setstate__({'capacity': count, 'storage': self.rows(slots, start, count), 'name': name})
+            inventory_rows.append(inventory)
+            if in_game:
+                inventories[key] = inventory
+
+        apiaries = []
+        a = t['apiaries']
+        for building, name, problem, princess, drone, inventory in zip(
+                a['building'], a['name'], a['problem'], a['princess'], a['drone'], a['inventory']):
+            cls = self.lookup(APIARY_BUILDINGS, building)
+            apiary = cls.__new__(cls)
+            apiary.__dict__.update({
+                'inv': self.row(inventory_rows, inventory), 'princess': self.row(slots, princess), 'drone': self.row(slots, drone),
+                'name': name, 'problem': self.lookup(ApiaryProblems.__members__, problem),
+                'add_resources': resources.add_resources, 'add_mating_entry': history.append, 'bestiary': bestiary,
+            })
+            apiaries.append(apiary)
+
+        analyzers = []
+        a = t['analyzers']
+        hints = list(zip(t['analyzer_hints']['species'], t['analyzer_hints']['other']))
+        for row in range(a[ROWS]):
+            cls = self.lookup(ANALYZER_BUILDINGS, a['building'][row])
+            analyzer = cls.__new__(cls)
+            analyzer.__dict__.update({
+                'name': a['name'][row], 'slot': self.row(slots, a['slot'][row]),
+                'time_left': _optional(a['time_left'][row]),
+                'amount_needed_to_consume': _optional(a['amount_needed_to_consume'][row]),
+                'species': self.species(a['species'][row]),
+                'hints': [(self.species(s), self.species(o)) for s, o in self.rows(hints, a['hints_start'][row], a['hints_count'][row])],
+                'time_to_analyze': a['time_to_analyze'][row], 'consumed_amount': a['consumed_amount'][row],
+            })
+            analyzers.append(analyzer)
+
+        achievements = default_achievements()
+        for achievement, achieved in zip(achievements, t['achievements']['achieved']):
+            achievement.achieved = bool(achieved)
+
+        state = {
+            'back_version': game['back_version'][0],
+            'resources': resources,
+            'inventories': inventories,
+            'apiaries': apiaries,
+            'analyzers': analyzers,
+            'total_inspections': game['total_inspections'][0],
+            'ticks': game['ticks'][0],
+            'mating_history': history,
+            'bestiary': bestiary,
+            'achievements': achievements,
+        }
+        if game['front_version'][0] != NONE:
+            self.build_front(state, slots)
+        if t['to_render'][ROWS]:
+            state['to_render'] = self.build_to_render(state, slots, inventory_rows)
+        if t['journal'][ROWS]:
+            self.build_journal(state)
+        return state
+
+    def build_bees(self, history: List[MatingEntry]) -> List[Bee]:
+        t = self.tables
+        b = t['bees']
+        _check_rows(b['kind'], len(BEE_KINDS), 'bee kind')
+        kinds = list(map(BEE_KINDS.__getitem__, b['kind']))
+
+        # every entry setter once, a bee refers to it by entry * roles + role
+        setters = [getattr(entry, role) for entry in history for role in ENTRY_ROLES]
+        entries = t['bee_entries']
+        _check_rows(entries['entry'], len(history), 'mating entry')
+        _check_rows(entries['role'], len(ENTRY_ROLES), 'entry role')
+        references = np.asarray(entries['entry'], dtype=np.int64) * len(ENTRY_ROLES) + np.asarray(entries['role'])
+        references = list(map(setters.__getitem__, references.tolist()))
+        _check_ranges(b['entries_start'], b['entries_count'], len(references), 'mating entry')
+
+        decode = self.genes_decoder()
+        genes = b['genes']
+        bees = []
+        for row, (cls, inspected, generation, start, count) in enumerate(zip(
+                kinds, b['inspected'], b['generation'], b['entries_start'], b['entries_count'])):
+            bee = cls.__new__(cls)
+            bee.genes = decode(genes[row * _GENES_SIZE:(row + 1) * _GENES_SIZE])
+            bee.inspected = inspected != 0
+            bee.mating_entries = references[start:start + count]
+            if cls is not Drone:
+                bee.generation = generation
+            bees.append(bee)
+
+        queens = np.flatnonzero(np.asarray(b['kind']) == BEE_KINDS.index(Queen)).tolist()
+        if queens:
+            children = t['bee_children']['bee']
+            _check_rows(children, len(bees), 'bee')
+            for column in ('parent1', 'parent2'):
+                _check_rows(np.asarray(b[column])[queens], len(bees), 'bee')
+            has_children = [row for row in queens if b['children_start'][row] != NONE]
+            _check_ranges(np.asarray(b['children_start'])[has_children], np.asarray(b['children_count'])[has_children], len(children), 'bee')
+        for row in queens:
+            bee = bees[row]
+            bee.parent1 = bees[b['parent1'][row]]
+            bee.parent2 = bees[b['parent2'][row]]
+            bee.lifespan = b['lifespan'][row]
+            bee.remaining_lifespan = b['remaining_lifespan'][row]
+            start = b['children_start'][row]
+            bee.children = None if start == NONE else [bees[child] for child in children[start:start + b['children_count'][row]]]
+        return bees
+
+    def build_slots(self, bees: List[Bee]) -> List[Slot]:
+        s = self.tables['slots']
+        _check_rows(s['bee'], len(bees), 'bee', allow_none=True)
+        bees = bees + [None] # NONE picks the last one
+        slots = []
+        for bee, amount in zip(s['bee'], s['amount']):
+            slot = Slot.__new__(Slot)
+            slot.slot = bees[bee]
+            slot.amount = amount
+            slots.append(slot)
+        return slots
+
+    def build_bestiary(self) -> Bestiary:
+        t = self.tables
+        produced = {species: {} for species in BeeSpecies}
+        p = t['bestiary_produced']
+        for species, resource, amount in zip(p['species'], p['resource'], p['amount']):
+            produced[self.species(species)][self.resource(resource)] = amount
+        bestiary = Bestiary.__new__(Bestiary)
+        known_bees = defaultdict(int)
+        for species, amount in zip(t['bestiary_bred']['species'], t['bestiary_bred']['amount']):
+            known_bees[self.species(species)] = amount
+        bestiary.__setstate__({
+            'produced_resources': {species: defaultdict(int, resources) for species, resources in produced.items()},
+            'known_bees': known_bees,
+        })
+        return bestiary
+
+    def build_front(self, state: dict, slots: List[Slot]):
+        game = self.tables['game']
+        w = self.tables['windows']
+        inventory_keys = list(state['inventories'])
+        state.update({
+            'front_version': game['front_version'][0],
+            'current_tutorial_stage': game['tutorial_stage'][0],
+            'apiary_list_opened': bool(game['apiary_list_opened'][0]),
+            'cursor_slot': Slot() if game['cursor_slot'][0] == NONE else self.row(slots, game['cursor_slot'][0]),
+            'inspect_windows': [], 'inspect_slots': [], 'apiary_windows': [], 'inventory_windows': [], 'analyzer_windows': [],
+        })
+        for kind, target, x, y, width, height in zip(w['kind'], w['target'], w['x'], w['y'], w['w'], w['h']):
+            rect = (x, y, width, height)
+            if kind == INSPECT_WINDOW:
+                state['inspect_windows'].append(rect)
+                state['inspect_slots'].append(self.row(slots, target))
+            elif kind == APIARY_WINDOW:
+                state['apiary_windows'].append((self.row(state['apiaries'], target), rect))
+            elif kind == INVENTORY_WINDOW:
+                state['inventory_windows'].append((self.row(inventory_keys, target), rect))
+            elif kind == ANALYZER_WINDOW:
+                state['analyzer_windows'].append(rect)
+
+    def build_journal(self, state: dict):
+        j = self.tables['journal']
+        try:
+            version, internal_state, gauss_next = json.loads(j['random_state'][0])
+            state.update({
+                'journal_generation': j['generation'][0],
+                'random_state': (version, tuple(internal_state), gauss_next),
+                'production_rng_state': json.loads(j['production_rng_state'][0]),
+            })
+        except ValueError as e:
+            raise SaveFormatError(f'Damaged journal state: {e}') from e
+
+    def build_to_render(self, state: dict, slots: List[Slot], inventory_rows: List[Inventory]) -> list:
+        r = self.tables['to_render']
+        to_render = []
+        for kind, target in zip(r['kind'], r['target']):
+            if kind == RENDER_RESOURCES:
+                to_render.append(state['resources'])
+            elif kind == RENDER_INVENTORY:
+                to_render.append(self.row(inventory_rows, target))
+            elif kind == RENDER_APIARY:
+                to_render.append(self.row(state['apiaries'], target))
+            elif kind == RENDER_SLOT:
+                to_render.append(self.row(slots, target))
+        return to_render
+
+    def resource(self, name: str):
+        return self.lookup(ResourceTypes.__members__, name)
+
+    @staticmethod
+    def lookup(mapping, name):
+        try:
+            return mapping[name]
+        except KeyError:
+            raise SaveFormatError(f'Unknown name {name!r} in the save')
+
+    @staticmethod
+    def row(rows, index):
+        if not 0 <= index < len(rows):
+            raise SaveFormatError(f'Reference to a missing row {index}')
+        return rows[index]
+
+    @staticmethod
+    def rows(rows, start, count):
+        if count == 0:
+            return rows[0:0]
+        if not (0 <= start and start + count <= len(rows)):
+            raise SaveFormatError(f'Reference to missing rows {start}..{start + count - 1}')
+        return rows[start:start + count]
+
+
+def _check_rows(column, rows: int, what: str, allow_none=False):
+    '''Every value of the column has to be a row below `rows`, or NONE if allowed'''
+    column = np.asarray(column)
+    if len(column) and (column.max() >= rows or column.min() < (NONE if allow_none else 0)):
+        raise SaveFormatError(f'Reference to a missing {what}')
+
+
+def _check_ranges(starts, counts, rows: int, what: str):
+    ends = np.asarray(starts, dtype=np.int64) + np.asarray(counts, dtype=np.int64)
+    if len(ends) and (ends.max() > rows or np.min(starts) < 0):
+        raise SaveFormatError(f'Reference to a missing {what}')
+
+
+def _optional(value: int):
+    return None if value == NONE else value
+
+
+def load(f) -> dict:
+    '''Reads a binary save into a state like the one `Game.get_state` returns'''
+    tables = _read_tables(f.read())
+    # building the state is one burst of allocations that stay alive, collecting during it only costs time
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _StateBuilder(tables).build()
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def convert_save(path: str, out_path: str = None):
+    '''Converts a pickled .forestry save to the binary format, in place unless `out_path` is given'''
+    from migration import migrate
+    with open(path, 'rb') as f:
+        data = f.read()
+    if is_binary_save(data):
+        return
+    state, _ = migrate(load_pickled(io.BytesIO(data)))
+    with open(out_path or path, 'wb') as f:
+        dump(state, f)
+
+
+# what saves made before the binary format contain, nothing else is unpickled
+PICKLED_GLOBALS = {
+    'forestry': {'Genes', 'Bee', 'Queen', 'Princess', 'Drone', 'Resources', 'Bestiary', 'MatingEntry', 'MatingHistory',
+                 'Slot', 'Inventory', 'ApiaryProblems', 'Apiary', 'Alveary', 'Analyzer', 'AnalyzerGold', 'AnalyzerString',
+                 'Achievement', 'ProducedProducts', 'BredSpecies'},
+    'builtins': {'object', 'set', 'frozenset', 'int', 'float', 'list', 'dict'},
+    'collections': {'defaultdict', 'OrderedDict', 'deque'},
+    'array': {'array', '_array_reconstructor'},
+    'copyreg': {'_reconstructor'},
+    'pygame': {'__rect_constructor'}, # windows of the front, pickled by pygame-ce
+    'pygame.rect': {'Rect'}, # and by pygame
+}
+# bound methods older buildings, bees and slots kept as callbacks
+PICKLED_METHODS = {'add_resources', 'append', 'set_something_changed',
+                   'set_parent1_inspected', 'set_parent2_inspected', 'set_child_inspected'}
+
+
+def _pickled_method(obj, name: str):
+    cls = type(obj)
+    if name not in PICKLED_METHODS or cls.__module__ != 'forestry' or cls.__name__ not in PICKLED_GLOBALS['forestry']:
+        raise SaveFormatError(f'The save refers to {type(obj).__name__}.{name}, which saves never contain')
+    return getattr(obj, name)
+
+
+class _SaveUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if name == 'TutorialStage' and module in ('__main__', 'ui.game_components.tutorial_stage'): # __main__ by gui.py
+            from ui.game_components import TutorialStage
+            return TutorialStage
+        if module == 'builtins' and name == 'getattr': # how bound methods are pickled
+            return _pickled_method
+        if module == 'config':
+            import config
+            value = getattr(config, name, None)
+            if isinstance(value, type) and issubclass(value, Enum):
+                return value
+        elif name in PICKLED_GLOBALS.get(module, ()):
+            return super().find_class(module, name)
+        raise SaveFormatError(f'The save refers to {module}.{name}, which saves never contain')
+
+
+def load_pickled(f) -> dict:
+    '''
+    Reads a save made before the binary format. Only the classes such saves
+    contain are unpickled, anything else raises `SaveFormatError`.
+    '''
+    try:
+        return _SaveUnpickler(f).load()
+    except (pickle.UnpicklingError, EOFError) as e:
+        raise SaveFormatError(f'Neither a binary nor a pickled save: {e}') from e
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        convert_save(path)
+        print('converted', path)
@@ -0,0 +1,119 @@
+'''
+Catalog of the saves: `saves/catalog.json` describes every save so menus can
+list them without opening a single save file.
+
+Every entry has the name, mtime and size of the file, the back version and
+compression of the save, the playtime in ticks, the number of species
+discovered and the totals of the resources. Whatever writes a save records
+it right after the file is in place, with a description taken from the state
+when it was captured. The catalog itself is rewritten atomically under a
+lock, so saves finished by background threads don't lose each other's
+entries.
+
+Files that appear in the directory by other means (copied in, or written
+before the catalog existed) are picked up with their mtime and size and no
+description; `rebuild` fills those in by reading the saves.
+'''
+import json
+import logging
+import os
+import sys
+import threading
+
+from .files import atomic_write
+
+CATALOG = 'catalog.json'
+SAVE_SUFFIX = '.forestry'
+CATALOG_VERSION = 1
+
+_lock = threading.Lock() # the catalog is read, changed and written as a whole
+
+
+def catalog_path(directory='saves'):
+    return os.path.join(directory, CATALOG)
+
+
+def describe(state: dict, compression=None) -> dict:
+    '''The part of an entry that comes from the state of the game'''
+    bestiary = state.get('bestiary')
+    return {
+        'version': state.get('back_version', 0),
+        'compression': compression,
+        'playtime': state.get('ticks', 0),
+        'species': sum(1 for amount in bestiary.known_bees.values() if amount > 0) if bestiary is not None else 0,
+        'resources': {res.name: amount for res, amount in state['resources'].res.items()} if 'resources' in state else {},
+    }
+
+
+def _read(directory) -> dict:
+    try:
+        with open(catalog_path(directory), 'r', encoding='utf-8') as f:
+            catalog = json.load(f)
+        if catalog.get('catalog_version') == CATALOG_VERSION:
+            return catalog['saves']
+    except FileNotFoundError:
+        pass
+    except (ValueError, KeyError, AttributeError):
+        logging.warning('the save catalog is damaged, rebuilding it')
+    return {}
+
+
+def _write(directory, saves: dict):
+    data = json.dumps({'catalog_version': CATALOG_VERSION, 'saves': saves}, ensure_ascii=False, indent=1)
+    atomic_write(catalog_path(directory), data.encode('utf-8'))
+
+
+def _file_entry(directory, name) -> dict:
+    stat = os.stat(os.path.join(directory, name + SAVE_SUFFIX))
+    return {'name': name, 'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def record(name: str, description: dict, directory='saves'):
+    '''Records the save `name`, call once its file is in place'''
+    with _lock:
+        saves = _read(directory)
+        saves[name] = {**_file_entry(directory, name), **description}
+        _write(directory, saves)
+
+
+def entries(directory='saves') -> dict:
+    '''
+    name -> entry of every save in `directory`. Only lists the directory,
+    entries of removed files are dropped and new files get a bare entry.
+    '''
+    if not os.path.exists(directory):
+        return {}
+    names = {file[:-len(SAVE_SUFFIX)] for file in os.listdir(directory) if file.endswith(SAVE_SUFFIX)}
+    with _lock:
+        saves = _read(directory)
+        if names == saves.keys():
+            return saves
+        saves = {name: saves.get(name) or _file_entry(directory, name) for name in names}
+        _write(directory, saves)
+        return saves
+
+
+def rebuild(directory='saves'):
+    '''Describes saves that have no description yet by loading them'''
+    from . import binary
+    from .compression import decompressing, detect_codec
+    for name, entry in entries(directory).items():
+        if 'playtime' in entry:
+            continue
+        path = os.path.join(directory, name + SAVE_SUFFIX)
+        try:
+            with open(path, 'rb') as raw:
+                codec = detect_codec(raw.peek(8))
+            with open(path, 'rb') as raw, decompressing(raw) as f:
+                if binary.is_binary_save(f.peek(len(binary.MAGIC))):
+                    state = binary.load(f)
+                else:
+                    state = binary.load_pickled(f)
+        except Exception:
+            logging.exception(f'could not describe the save {name}')
+            continue
+        record(name, describe(state, codec), directory)
+
+
+if __name__ == '__main__':
+    rebuild(*sys.argv[1:2])
@@ -0,0 +1,64 @@
+'''
+Optional compression of save files.
+
+Saves are compressed while they are written: the serializer writes into a
+compressing file object, so the compressed save is never built in memory as
+a whole. The codec is chosen per save and recognized by the header of the
+file when it is read, uncompressed saves are read as they are.
+
+    zlib    deflate in a gzip container, fast
+    lzma    xz container, smaller and slower
+'''
+import gzip
+import lzma
+import zlib
+from contextlib import contextmanager
+
+from .binary import SaveFormatError
+
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+HEADER_SIZE = len(XZ_MAGIC)
+
+CODECS = ('zlib', 'lzma')
+
+
+def detect_codec(head: bytes):
+    '''The codec a file starting with `head` is compressed with, None if it isn't'''
+    if head.startswith(GZIP_MAGIC):
+        return 'zlib'
+    if head.startswith(XZ_MAGIC):
+        return 'lzma'
+    return None
+
+
+@contextmanager
+def compressing(f, codec=None):
+    '''Writes through `codec` into the binary file `f`, `f` itself if codec is None'''
+    if codec is None:
+        yield f
+        return
+    if codec == 'zlib':
+        # mtime is fixed so the same state always gives the same file
+        compressed = gzip.GzipFile(fileobj=f, mode='wb', compresslevel=6, mtime=0)
+    elif codec == 'lzma':
+        compressed = lzma.LZMAFile(f, 'wb', preset=6)
+    else:
+        raise ValueError(f'Unknown compression {codec!r}, expected one of {CODECS}')
+    with compressed:
+        yield compressed
+
+
+@contextmanager
+def decompressing(f):
+    '''Reads the binary file `f` decompressed with the codec its header names'''
+    codec = detect_codec(f.peek(HEADER_SIZE)[:HEADER_SIZE])
+    if codec is None:
+        yield f
+        return
+    opener = gzip.GzipFile(fileobj=f, mode='rb') if codec == 'zlib' else lzma.LZMAFile(f, 'rb')
+    try:
+        with opener as decompressed:
+            yield decompressed
+    except (EOFError, gzip.BadGzipFile, zlib.error, lzma.LZMAError) as e:
+        raise SaveFormatError(f'Damaged {codec} stream: {e}') from e
@@ -0,0 +1,26 @@
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_open(path, mode='wb'):
+    '''
+    File that replaces `path` once the block finishes, so readers never see
+    half of it. Nothing is replaced if the block raises.
+    '''
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def atomic_write(path, data: bytes):
+    with atomic_open(path) as f:
+        f.write(data)
@@ -0,0 +1,152 @@
+'''
+Journaled saves: a snapshot of the game plus an append-only log of what
+happened since.
+
+The snapshot is a regular save (`saves/<name>.forestry`) that also carries
+its generation and the states of the random generators. Every generation has
+its own log, `saves/<name>.<generation>.journal`, with one line per record:
+
+    c <command>    a console command that changes the state
+    t <ticks>      a `Game.tick` batch
+
+Commands and ticks both run under `Game.state_lock`, so the log has them in
+the order they happened and replaying it on top of the snapshot draws the
+same random numbers. A record is written with a single append, a crash can
+only cut the last line, which is then ignored.
+
+Compaction starts a new generation: the game is captured into plain columns
+(see `binary.capture`) at a tick boundary and new records go to the next log
+right away, while a background thread serializes the snapshot in the binary
+format and fsyncs it. Logs of older generations are removed once the
+snapshot is in place; until then loading replays them one after another.
+Buildings are rescheduled at every generation boundary both in the running
+game and during replay, the same way loading does, so the update order stays
+identical.
+
+Only changes made through console commands are recorded, the GUI edits
+slots directly and keeps using regular saves.
+'''
+import os
+import random
+import threading
+
+from . import binary, catalog
+from .compression import compressing
+from .files import atomic_open
+
+COMMAND = 'c'
+TICKS = 't'
+
+
+def snapshot_path(name, directory='saves'):
+    return os.path.join(directory, name + '.forestry')
+
+
+def log_path(name, generation, directory='saves'):
+    return os.path.join(directory, f'{name}.{generation}.journal')
+
+
+def read_log(path):
+    '''Records of the log as (kind, argument), a cut last line is dropped'''
+    with open(path, 'r', encoding='utf-8') as f:
+        data = f.read()
+    records = []
+    for line in data.split('\n')[:-1]:
+        kind, _, argument = line.partition(' ')
+        records.append((kind, argument))
+    return records
+
+
+class Journal:
+    compact_every = 1000 # records per generation
+    fsync = False # flush every record to disk, otherwise only a crash of the machine loses records
+
+    def __init__(self, game, name, directory='saves', generation=-1):
+        self.game = game
+        self.name = name
+        self.directory = directory
+        self.generation = generation
+        self.records = 0
+        self.fd = None
+        self.compaction = None # thread writing the latest snapshot
+
+    def record_command(self, command: str):
+        self.append(COMMAND + ' ' + ' '.join(command.split()))
+
+    def record_ticks(self, ticks: int):
+        self.append(f'{TICKS} {ticks}')
+
+    def append(self, record: str):
+        os.write(self.fd, (record + '\n').encode('utf-8'))
+        if self.fsync:
+            os.fsync(self.fd)
+        self.records += 1
+        if self.records >= self.compact_every:
+            self.compact()
+
+    def compact(self, wait=False):
+        '''Starts the next generation, must be called under `Game.state_lock`'''
+        game = self.game
+        game.attach_buildings()
+        self.generation += 1
+        state = game.get_state()
+        state['journal_generation'] = self.generation
+        state['random_state'] = random.getstate()
+        state['production_rng_state'] = game.production.rng.bit_generator.state
+        compression = game.save_compression
+        snapshot = (binary.capture(state), catalog.describe(state, compression), compression)
+
+        if self.fd is not None:
+            os.close(self.fd)
+        os.makedirs(self.directory, exist_ok=True)
+        self.fd = os.open(log_path(self.name, self.generation, self.directory),
+                          os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND)
+        self.records = 0
+
+        previous = self.compaction
+        self.compaction = threading.Thread(target=self.write_snapshot, args=(snapshot, self.generation, previous))
+        self.compaction.start()
+        if wait:
+            self.compaction.join()
+
+    def write_snapshot(self, snapshot: tuple, generation: int, previous: threading.Thread):
+        if previous is not None:
+            previous.join()
+        tables, description, compression = snapshot
+        with atomic_open(snapshot_path(self.name, self.directory)) as f, compressing(f, compression) as out:
+            binary.write(tables, out)
+        catalog.record(self.name, description, self.directory)
+        for old_generation in range(generation - 1, -1, -1):
+            path = log_path(self.name, old_generation, self.directory)
+            if not os.path.exists(path):
+                break
+            os.remove(path)
+
+    def close(self):
+        if self.compaction is not None:
+            self.compaction.join()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+def replay_journal(game, name, state: dict, directory='saves') -> int:
+    '''
+    Replays the logs on top of the loaded snapshot `state`, returns the last
+    generation found. The game must not record into a journal meanwhile.
+    '''
+    random.setstate(state['random_state'])
+    game.production.rng.bit_generator.state = state['production_rng_state']
+    generation = state['journal_generation']
+    while True:
+        path = log_path(name, generation, directory)
+        records = read_log(path) if os.path.exists(path) else []
+        for kind, argument in records:
+            if kind == COMMAND:
+                game.execute_command(argument)
+            elif kind == TICKS:
+                game.tick(int(argument))
+        if not os.path.exists(log_path(name, generation + 1, directory)):
+            return generation
+        generation += 1
+        game.attach_buildings()
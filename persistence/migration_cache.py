@@ -0,0 +1,43 @@
+'''
+Saves of older versions are migrated once: the migrated state is kept next
+to the save in `<save>.migrated`, a binary save prefixed with the hash of
+the file it was made from. Loading the same file again reads the cache
+instead of running the migrations, a cache made from another version of the
+file is removed.
+'''
+import hashlib
+import os
+
+from . import binary
+from .compression import compressing, decompressing
+from .files import atomic_open
+
+SUFFIX = '.migrated'
+HASH_SIZE = hashlib.sha256().digest_size
+
+
+def cache_path(path: str) -> str:
+    return path + SUFFIX
+
+
+def load(path: str, source: bytes):
+    '''The cached state migrated from `source`, the contents of `path`, None if there is none'''
+    cache = cache_path(path)
+    if not os.path.exists(cache):
+        return None
+    with open(cache, 'rb') as f:
+        if f.read(HASH_SIZE) == hashlib.sha256(source).digest():
+            try:
+                with decompressing(f) as data:
+                    return binary.load(data)
+            except binary.SaveFormatError:
+                pass
+    os.remove(cache)
+    return None
+
+
+def store(path: str, source: bytes, state: dict):
+    with atomic_open(cache_path(path)) as f:
+        f.write(hashlib.sha256(source).digest())
+        with compressing(f, 'zlib') as out:
+            binary.dump(state, out)
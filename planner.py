@@ -0,0 +1,142 @@
+'''
+Breeding planner: the cheapest sequence of pairings that reaches a species.
+
+Species are nodes of the mutation graph and every mutation A + B -> C is a
+hyperedge that needs both A and B. The search is Knuth's generalization of
+Dijkstra to such graphs: a species is settled once its cheapest recipe is
+known, and a mutation is relaxed as soon as both of its parents are settled.
+
+Costs are expected queens: for a purebred pair of the default genomes, the
+queens needed until one child carries the new allele, plus a fixed estimate
+of the queens needed to purebreed it. The cost of a recipe is that of every
+species it breeds or starts from, counted once, as in the plan that comes
+out: IMPERIAL <- MAJESTIC + NOBLE pays for the NOBLE both of them need a
+single time. Such costs don't add up along the graph, so the search is
+greedy, each species keeps the cheapest recipe found when it is settled.
+'''
+import heapq
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from config import BeeSpecies, mutation_partners
+from forestry import Bee, Genes, default_genes
+
+QUEENS_TO_PUREBREED = 2 # estimate: from the first carrier to a purebred princess and drone
+
+
+@dataclass(frozen=True)
+class BreedingStep:
+    princess: BeeSpecies
+    drone: BeeSpecies
+    offspring: BeeSpecies
+    probability: float # that a single child carries the offspring allele
+    expected_queens: float
+    expected_ticks: float
+
+
+@dataclass(frozen=True)
+class BreedingPlan:
+    target: BeeSpecies
+    steps: Tuple[BreedingStep, ...]
+    expected_queens: float
+    expected_ticks: float
+
+
+def purebred_genes(species: BeeSpecies) -> Genes:
+    return Genes(**{k: (g, g) for k, g in default_genes[species].items()})
+
+
+@lru_cache(maxsize=None)
+def breeding_step(princess: BeeSpecies, drone: BeeSpecies, offspring: BeeSpecies) -> BreedingStep:
+    '''Expected cost of breeding `offspring` from purebred default bees'''
+    princess_genes = purebred_genes(princess)
+    distribution = princess_genes.offspring_distribution(purebred_genes(drone))
+    probability = sum(p for genes, p in distribution.items() if offspring in genes.species)
+
+    children = 1 + princess_genes.fertility[0].value
+    expected_queens = 1 / (1 - (1 - probability) ** children) + QUEENS_TO_PUREBREED
+    ticks_per_queen = princess_genes.lifespan[0].value + 1 # a queen dies on the tick after her lifespan runs out
+    return BreedingStep(princess, drone, offspring, probability, expected_queens, expected_queens * ticks_per_queen)
+
+
+@lru_cache(maxsize=None)
+def cheapest_step(parent1: BeeSpecies, parent2: BeeSpecies, offspring: BeeSpecies) -> BreedingStep:
+    '''Either parent can be the princess, take the faster one'''
+    return min(breeding_step(parent1, parent2, offspring),
+               breeding_step(parent2, parent1, offspring),
+               key=lambda step: (step.expected_queens, step.expected_ticks))
+
+
+def available_species(population: Iterable[Bee]) -> FrozenSet[Tuple[BeeSpecies, float]]:
+    '''Species in the population with their starting cost: 0 if purebred, otherwise the cost to purebreed'''
+    costs: Dict[BeeSpecies, float] = {}
+    for bee in population:
+        allele1, allele2 = bee.genes.species
+        cost = 0 if allele1 == allele2 else QUEENS_TO_PUREBREED
+        for allele in (allele1, allele2):
+            costs[allele] = min(costs.get(allele, cost), cost)
+    return frozenset(costs.items())
+
+
+@lru_cache(maxsize=1024)
+def plan_from_species(available: FrozenSet[Tuple[BeeSpecies, float]], target: BeeSpecies) -> Optional[BreedingPlan]:
+    '''Cheapest plan from (species, starting cost) pairs, None if the target is unreachable'''
+    starting_costs = dict(available)
+    recipe: Dict[BeeSpecies, BreedingStep] = {}
+    # species a plan breeds or starts from, shared ancestors of both parents are only paid once
+    ancestry: Dict[BeeSpecies, FrozenSet[BeeSpecies]] = {species: frozenset([species]) for species in starting_costs}
+    def own_cost(species):
+        return recipe[species].expected_queens if species in recipe else starting_costs[species]
+
+    cost: Dict[BeeSpecies, float] = dict(starting_costs)
+    settled = set()
+    heap = [(c, species.value, species) for species, c in cost.items()]
+    heapq.heapify(heap)
+    while heap:
+        c, _, species = heapq.heappop(heap)
+        if species in settled:
+            continue
+        settled.add(species)
+        if species == target:
+            break
+        for other, offspring, _ in mutation_partners.get(species, []):
+            if other not in settled:
+                continue
+            parents = ancestry[species] | ancestry[other]
+            parents_cost = sum(own_cost(parent) for parent in parents)
+            for child in offspring:
+                if child in settled:
+                    continue
+                step = cheapest_step(species, other, child)
+                new_cost = parents_cost + step.expected_queens
+                if new_cost < cost.get(child, float('inf')):
+                    cost[child] = new_cost
+                    recipe[child] = step
+                    ancestry[child] = parents | {child}
+                    heapq.heappush(heap, (new_cost, child.value, child))
+    if target not in settled:
+        return None
+
+    # parents before children, every species bred once
+    steps: List[BreedingStep] = []
+    seen = set()
+    def visit(species):
+        if species in seen or species not in recipe:
+            return
+        seen.add(species)
+        step = recipe[species]
+        visit(step.princess)
+        visit(step.drone)
+        steps.append(step)
+    visit(target)
+
+    # species that are only present in hybrids have to be purebred first
+    expected_ticks = sum(step.expected_ticks for step in steps)
+    for species in ancestry[target] - recipe.keys():
+        expected_ticks += starting_costs[species] * (default_genes[species]['lifespan'].value + 1)
+    return BreedingPlan(target, tuple(steps), cost[target], expected_ticks)
+
+
+def plan_breeding(population: Iterable[Bee], target: BeeSpecies) -> Optional[BreedingPlan]:
+    return plan_from_species(available_species(population), target)
@@ -1,6 +1,10 @@
-import pickle
 from pprint import pprint
 
-with open('save.forestry', 'rb') as f:
-    save = pickle.load(f)
+from persistence import binary, decompressing
+
+with open('save.forestry', 'rb') as raw, decompressing(raw) as f:
+    if binary.is_binary_save(f.peek(len(binary.MAGIC))):
+        save = binary.load(f)
+    else:
+        save = binary.load_pickled(f)
     pprint(save)
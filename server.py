@@ -1,12 +1,24 @@
-from aiohttp import web
+import argparse
+import asyncio
+import json
+import logging
+
+from aiohttp import WSMsgType, web
 
 from console_game import ConsoleGame
+from sessions import SessionLimitError, SessionManager
+from tick_scheduler import TickScheduler
 
 PORT = 8081
+TICK_WORKERS = 4 # threads ticking the session games, 0 ticks them on the event loop
+SESSION_COOKIE = 'session'
+GAME_ENDPOINTS = {'/out', '/command_out', '/command', '/ws', '/events'} # the ones that have a session
 
 
 class WebInterface(ConsoleGame):
-    def __init__(self):
+    coalesce_window = 0.05 # seconds, outputs changed within it are pushed as one frame
+
+    def __init__(self, real_time=True, render_thread=True):
         self.out = {'text': ''}
         self.command_out = {'text': ''}
         self.text_memory = []
@@ -15,50 +27,214 @@ class WebInterface(ConsoleGame):
         self.print_buffer = []
         self.print_buffer_size = 0
 
-        super().__init__()
+        self.loop = None # event loop of the server, set once it runs
+        self.listeners = set() # asyncio.Event of every push connection
+
+        super().__init__(real_time, render_thread)
 
     def print(self, *strings, sep=' ', end='\n', flush=False, out=None):
         if out is None:
             out = self.out
         thing = sep.join(map(str, strings)) + end
 
-        self.print_buffer.append(thing)
-        self.print_buffer_size += len(thing)
-        if flush:
-            out['text'] = ''.join(self.print_buffer)
-            self.print_buffer = []
-            self.print_buffer_size = 0
+        with self.state_lock: # the buffer is shared by frames, command echoes and tick workers
+            self.print_buffer.append(thing)
+            self.print_buffer_size += len(thing)
+            if flush:
+                out['text'] = ''.join(self.print_buffer)
+                self.print_buffer = []
+                self.print_buffer_size = 0
+                self.outputs_changed()
+
+    def outputs_changed(self):
+        '''Wakes the push connections, may be called from any thread'''
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wake_listeners)
+
+    def wake_listeners(self):
+        for listener in self.listeners:
+            listener.set()
+
+    async def push_frames(self, send):
+        '''
+        Sends {'out': ..., 'command_out': ...} with the outputs that changed
+        since the last frame, the first frame has both. Runs until the game
+        exits or `send` fails because the client left.
+        '''
+        wakeup = asyncio.Event()
+        self.listeners.add(wakeup)
+        sent = {}
+        try:
+            while not self.exit_event.is_set():
+                frame = {key: out['text'] for key, out in (('out', self.out), ('command_out', self.command_out))
+                         if sent.get(key) != out['text']}
+                if frame:
+                    await send(frame)
+                    sent.update(frame)
+                await wakeup.wait()
+                await asyncio.sleep(self.coalesce_window) # a command echo and its frame come close together
+                wakeup.clear()
+        except ConnectionResetError:
+            pass
+        finally:
+            self.listeners.discard(wakeup)
 
     def render(self):
+        # sleeps until `state_updated` or a command asks for a frame
         while True:
+            self.render_event.wait()
             if self.exit_event.is_set():
                 self.print(flush=True)
                 break
 
             super().render_frame()
 
+    def exit(self):
+        super().exit()
+        self.render_event.set() # wake the render thread so it can stop
+        self.outputs_changed() # and the push connections
+
 
 async def game(request):
     return web.FileResponse('my-app/build/index.html')
 
 
+def session_token(request):
+    return request.cookies.get(SESSION_COOKIE) or request.headers.get('X-Session') or request.query.get('session')
+
+
+def remember_session(token, response):
+    '''Hands the token to the client, must happen before streamed responses are prepared'''
+    response.set_cookie(SESSION_COOKIE, token, httponly=True, samesite='Lax')
+    response.headers['X-Session'] = token
+
+
+@web.middleware
+async def session_middleware(request, handler):
+    if request.path not in GAME_ENDPOINTS: # the front itself, or nothing at all
+        return await handler(request)
+    request['token'] = token = await backend.resolve(session_token(request))
+    response = await handler(request)
+    if not response.prepared:
+        remember_session(token, response)
+    return response
+
+
 async def out(request):
-    return web.json_response(web_interface.out)
+    return web.json_response({'text': await backend.output(request['token'], 'out')})
 
 
 async def command_out(request):
-    return web.json_response(web_interface.command_out)
+    return web.json_response({'text': await backend.output(request['token'], 'command_out')})
 
 
 async def command(request):
-    if web_interface.exit_event.is_set():
-        return
-    value = await request.text()
-    web_interface.print(value, out=web_interface.command_out, flush=True)
-    web_interface.execute_command(value)
+    if not await backend.command(request['token'], await request.text()):
+        return web.Response(text='The game has ended')
     return web.Response(text='Success')
 
 
+async def websocket(request):
+    '''
+    Pushes frames of the outputs, text messages are run as commands. A
+    command that fails is answered with an {'error': ...} frame.
+    '''
+    token = request['token']
+    ws = web.WebSocketResponse()
+    remember_session(token, ws)
+    await ws.prepare(request)
+    pusher = asyncio.create_task(backend.push_frames(token, ws.send_json))
+    pusher.add_done_callback(lambda _: asyncio.ensure_future(ws.close())) # the game ended
+    try:
+        async for message in ws:
+            if message.type == WSMsgType.TEXT:
+                try:
+                    await backend.command(token, message.data)
+                except web.HTTPException as e: # of the sharded backend
+                    await ws.send_json({'error': e.text})
+                except Exception as e: # a bad command ends neither the connection nor the game
+                    logging.exception(f'command {message.data!r} failed')
+                    await ws.send_json({'error': f'{type(e).__name__}: {e}'})
+    finally:
+        pusher.cancel()
+    return ws
+
+
+async def events(request):
+    '''Server-sent events fallback of `websocket`, one `data:` line of json per frame'''
+    token = request['token']
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache',
+                                           'Access-Control-Allow-Origin': '*'}) # sent before the middleware adds it
+    remember_session(token, response)
+    await response.prepare(request)
+    async def send(frame):
+        await response.write(b'data: ' + json.dumps(frame).encode('utf-8') + b'\n\n')
+    await backend.push_frames(token, send)
+    return response
+
+
+def run_command(game, value):
+    game.print(value, out=game.command_out, flush=True)
+    game.execute_command(value)
+
+
+def session_game(loop):
+    # sessions are ticked by the scheduler and rendered by whoever changed them
+    game = WebInterface(real_time=False, render_thread=False)
+    game.loop = loop
+    return game
+
+
+class LocalSessions:
+    '''
+    Sessions hosted by this process. The handlers talk to it, or to
+    `shards.ShardedSessions` which has the same methods, through `backend`.
+    '''
+    def __init__(self, adopt_tokens=False, checkpoint_interval=None):
+        self.scheduler = TickScheduler(TICK_WORKERS)
+        self.sessions = SessionManager(session_game, self.scheduler, checkpoint_interval=checkpoint_interval)
+        self.adopt_tokens = adopt_tokens # a front end hands out the tokens
+
+    async def session(self, token):
+        try:
+            return await self.sessions.get(token, adopt=self.adopt_tokens)
+        except SessionLimitError as e:
+            raise web.HTTPServiceUnavailable(text=f'The server is full, try again later ({e})')
+
+    async def resolve(self, token) -> str:
+        return (await self.session(token)).token
+
+    async def output(self, token, key) -> str:
+        return getattr((await self.session(token)).game, key)['text']
+
+    async def command(self, token, value) -> bool:
+        '''Runs the command, False if the game has ended'''
+        game = (await self.session(token)).game
+        if game.exit_event.is_set():
+            return False
+        run_command(game, value)
+        return True
+
+    async def push_frames(self, token, send) -> bool:
+        '''Pushes frames until the game ends, True if it ended by being evicted'''
+        session = await self.session(token)
+        session.connections += 1
+        try:
+            await session.game.push_frames(send)
+        finally:
+            session.connections -= 1
+            session.touch()
+        return session.evicted
+
+    async def start(self):
+        self.scheduler.start()
+        self.sessions.start()
+
+    async def close(self):
+        await self.sessions.close()
+        self.scheduler.stop()
+
+
 @web.middleware
 async def cors_middleware(request, handler):
     response = await handler(request)
@@ -66,19 +242,46 @@ async def cors_middleware(request, handler):
     return response
 
 
-try:
-    web_interface = WebInterface()
-    app = web.Application(middlewares=[cors_middleware])
+async def start_backend(app):
+    await backend.start()
+
+
+async def close_backend(app):
+    await backend.close()
+
+
+def main():
+    global backend
+    parser = argparse.ArgumentParser(description='Serves the game over http, a separate game for every player')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=0,
+                        help='simulate the sessions in this many processes, 0 keeps them in the server process')
+    args = parser.parse_args()
+    if args.workers:
+        from shards import ShardedSessions
+        backend = ShardedSessions(args.workers)
+    else:
+        backend = LocalSessions()
+
+    app = web.Application(middlewares=[cors_middleware, session_middleware])
+    app.on_startup.append(start_backend)
+    app.on_shutdown.append(close_backend)
     app.add_routes([
         web.get('/game', game),
         web.get('/out', out),
         web.get('/command_out', command_out),
-        web.post('/command', command)
+        web.post('/command', command),
+        web.get('/ws', websocket),
+        web.get('/events', events),
     ])
     try:
         app.add_routes([web.static('/game', 'my-app/build')])
     except ValueError:
         print("The front wasn't built yet, so started only back")
-    web.run_app(app, port=PORT)
-finally:
-    web_interface.execute_command('q')
\ No newline at end of file
+    web.run_app(app, port=args.port)
+
+
+backend = None # LocalSessions or ShardedSessions, set by `main`
+
+if __name__ == '__main__':
+    main()
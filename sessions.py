@@ -0,0 +1,207 @@
+'''
+Sessions of the web server: every player gets their own game, found by a
+token that the server hands out as a cookie (or takes from the `X-Session`
+header / `session` query parameter, for clients without cookies).
+
+Live games have no threads of their own. They are ticked by a shared
+`TickScheduler`, and frames are rendered right when a tick or a command
+changes the state. A session that had no requests and no open push
+connection for `ttl` seconds is written to `directory` and dropped from
+memory; its next request loads it back, migrated like any save. Session
+files are read and written on the executor, never on the event loop. At
+`max_live` live sessions no more are created or loaded, `get` raises
+`SessionLimitError` until idle ones were evicted. With `checkpoint_interval`
+live sessions are also written periodically, so a crash of the process loses
+at most that much. A game that is stopped with `exit` ends its session.
+'''
+import asyncio
+import logging
+import os
+import re
+import secrets
+import time
+from typing import Callable, Dict, Optional
+
+from persistence import atomic_open, binary
+from tick_scheduler import TickScheduler
+
+TOKEN_PATTERN = re.compile(r'[A-Za-z0-9_-]{16,64}') # tokens become file names
+
+
+class SessionLimitError(RuntimeError):
+    pass
+
+
+class Session:
+    def __init__(self, token, game):
+        self.token = token
+        self.game = game
+        self.last_used = time.monotonic()
+        self.connections = 0 # open push connections
+        self.evicted = False # its game exited because it was written to disk, not by the player
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def idle(self, now, ttl) -> bool:
+        return self.connections == 0 and now - self.last_used >= ttl
+
+
+class SessionManager:
+    sweep_interval = 1 # seconds between checks for idle sessions
+
+    def __init__(self, make_game: Callable, scheduler: TickScheduler, directory='saves/sessions', ttl=600, max_live=100,
+                 checkpoint_interval=None):
+        self.make_game = make_game # (loop) -> a game without threads of its own
+        self.scheduler = scheduler
+        self.directory = directory
+        self.ttl = ttl # seconds
+        self.max_live = max_live
+        self.checkpoint_interval = checkpoint_interval # seconds, None writes sessions only when evicting them
+        self.live: Dict[str, Session] = {} # least recently used first
+        self.writes: Dict[str, asyncio.Future] = {} # token -> latest write of the session still running
+        self.opening: Dict[str, asyncio.Future] = {} # token -> load of the session from disk
+        self.loop = None
+        self.task = None
+
+    def path(self, token) -> str:
+        return os.path.join(self.directory, token + '.forestry')
+
+    async def get(self, token: Optional[str], adopt=False) -> Session:
+        '''
+        The session of `token`, loaded from disk if it was evicted. An unknown
+        token gets a new session with a new token, or with this one if `adopt`.
+        '''
+        session = self.live.get(token) if token else None
+        if session is not None and session.game.exit_event.is_set():
+            await self.discard(token)
+            session = None
+        if session is None:
+            session = await self.open(token, adopt)
+        self.live.pop(session.token, None) # added back as the most recently used
+        self.live[session.token] = session
+        session.touch()
+        return session
+
+    def check_room(self):
+        if len(self.live) >= self.max_live:
+            raise SessionLimitError(f'{self.max_live} games are running already')
+
+    async def open(self, token: Optional[str], adopt: bool) -> Session:
+        '''A session that isn't live: the one written to disk, or a new one'''
+        self.check_room()
+        if token is None or TOKEN_PATTERN.fullmatch(token) is None:
+            return self.start_session(secrets.token_urlsafe(24))
+        opening = self.opening.get(token)
+        if opening is None: # requests that come meanwhile wait for the same load
+            opening = self.opening[token] = asyncio.ensure_future(self.load(token, adopt))
+            opening.add_done_callback(lambda _: self.opening.pop(token) if self.opening.get(token) is opening else None)
+        return await asyncio.shield(opening)
+
+    async def load(self, token: str, adopt: bool) -> Session:
+        await self.flush(token) # it may be on its way to the disk
+        state = None
+        if os.path.exists(self.path(token)):
+            state = await self.loop.run_in_executor(None, read_state, self.path(token))
+        self.check_room()
+        return self.start_session(token if state is not None or adopt else secrets.token_urlsafe(24), state)
+
+    def start_session(self, token: str, state: Optional[dict] = None) -> Session:
+        game = self.make_game(self.loop)
+        if state is not None:
+            game.set_state(state)
+            game.to_render = [game.resources, game.inv, game.apiaries[0]]
+            game.request_frame()
+        self.scheduler.add(game)
+        return Session(token, game)
+
+    def write(self, session: Session) -> asyncio.Future:
+        '''Writes the session on the executor, after the writes of it that are still running'''
+        token = session.token
+        future = asyncio.ensure_future(self.write_after(self.writes.get(token), session.game, self.path(token)))
+        self.writes[token] = future
+        future.add_done_callback(lambda _: self.writes.pop(token) if self.writes.get(token) is future else None)
+        return future
+
+    async def write_after(self, previous: Optional[asyncio.Future], game, path: str):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await self.loop.run_in_executor(None, write_state, game, path)
+        except OSError:
+            logging.exception(f'could not write {path}')
+
+    async def flush(self, token):
+        '''Waits until the session of `token` is on disk'''
+        future = self.writes.get(token)
+        if future is not None:
+            await asyncio.wait([future])
+
+    async def evict(self, token):
+        session = self.live.pop(token)
+        game = session.game
+        self.scheduler.remove(game)
+        if not game.exit_event.is_set():
+            session.evicted = True
+            await self.write(session)
+        game.exit() # also ends its push connections
+        logging.info(f'session {token} evicted')
+
+    async def checkpoint(self):
+        await asyncio.gather(*(self.write(session) for session in list(self.live.values())
+                               if not session.game.exit_event.is_set()))
+
+    async def discard(self, token):
+        '''Ends a session whose game exited'''
+        self.scheduler.remove(self.live.pop(token).game)
+        await self.flush(token)
+        if os.path.exists(self.path(token)):
+            os.remove(self.path(token))
+
+    async def run(self):
+        '''Evicts idle sessions, ends the ones whose game exited and writes checkpoints'''
+        last_checkpoint = time.monotonic()
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            now = time.monotonic()
+            if self.checkpoint_interval is not None and now - last_checkpoint >= self.checkpoint_interval:
+                await self.checkpoint()
+                last_checkpoint = now
+            for token, session in list(self.live.items()):
+                if self.live.get(token) is not session: # gone while an earlier one was written
+                    continue
+                if session.game.exit_event.is_set():
+                    await self.discard(token)
+                elif session.idle(time.monotonic(), self.ttl):
+                    await self.evict(token)
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.task = asyncio.create_task(self.run())
+
+    async def close(self):
+        '''Writes every live session to disk'''
+        if self.task is not None:
+            self.task.cancel()
+        await asyncio.gather(*(self.evict(token) for token in list(self.live)))
+        await asyncio.gather(*list(self.writes.values()))
+
+
+def read_state(path: str) -> Optional[dict]:
+    '''The migrated state of a session file, None if it can't be loaded'''
+    from migration import migrate
+    try:
+        with open(path, 'rb') as f:
+            state, _ = migrate(binary.load(f))
+        return state
+    except Exception:
+        logging.exception(f'session {path} could not be loaded')
+        return None
+
+
+def write_state(game, path: str):
+    with game.state_lock: # captured between ticks, written without holding up the game
+        tables = binary.capture(game.get_state())
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_open(path) as f:
+        binary.write(tables, f)
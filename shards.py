@@ -0,0 +1,329 @@
+'''
+Sharded hosting: the sessions are simulated by `workers` processes, so the
+games of different players don't share one GIL. Run with
+`python server.py --workers N`.
+
+Every worker is a `server.LocalSessions` behind a Unix socket. The aiohttp
+process hands out the tokens and places every session on a worker by
+consistent hashing (`HashRing`), so adding or removing a worker only moves
+the sessions that belong to it. Messages are lines of json, one request and
+one reply per connection; a `frames` request keeps its connection and
+streams `{'frame': ...}` lines until the session ends or moves.
+
+The front end pings the workers every `health_interval` seconds. A worker
+that doesn't answer, or whose process died, leaves the ring and is
+restarted, a request that fails only gets an error. While a worker is
+away its sessions are loaded by the next workers on the ring from their
+last checkpoint in the shared sessions directory. When
+it is back, the ring changes again and the other workers write those
+sessions to disk and let go of them before any request reaches it. Workers
+refuse requests for sessions that the ring they were told about places
+elsewhere, and the front end retries those with the current ring.
+'''
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import secrets
+import shutil
+import signal
+import tempfile
+from typing import Iterable, Optional
+
+from aiohttp import web
+
+from sessions import TOKEN_PATTERN
+
+VIRTUAL_NODES = 64 # points of every worker on the ring, evens out the shares
+CHECKPOINT_INTERVAL = 30 # seconds, what a crashed worker loses at most
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    def __init__(self, workers: Iterable[int]):
+        self.points = sorted((_hash(f'{worker}#{i}'), worker) for worker in workers for i in range(VIRTUAL_NODES))
+        self.keys = [point for point, _ in self.points]
+
+    def __bool__(self):
+        return bool(self.points)
+
+    def worker_for(self, token: str) -> int:
+        i = bisect.bisect(self.keys, _hash(token)) % len(self.points)
+        return self.points[i][1]
+
+
+async def send_message(writer: asyncio.StreamWriter, message: dict):
+    writer.write(json.dumps(message).encode('utf-8') + b'\n')
+    await writer.drain()
+
+
+async def read_message(reader: asyncio.StreamReader) -> dict:
+    line = await reader.readline()
+    if not line:
+        raise ConnectionResetError('the other side closed the connection')
+    return json.loads(line)
+
+
+def worker_main(index: int, socket_path: str, workers: int):
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # the front end shuts the workers down and waits for their sessions
+    asyncio.run(_serve(index, socket_path, workers))
+
+
+async def _serve(index: int, socket_path: str, workers: int):
+    from server import LocalSessions
+    backend = LocalSessions(adopt_tokens=True, checkpoint_interval=CHECKPOINT_INTERVAL)
+    await backend.start()
+    ring = HashRing(range(workers))
+    stopped = asyncio.Event()
+
+    async def dispatch(message, reader, writer) -> Optional[dict]:
+        nonlocal ring
+        op, token = message['op'], message.get('token')
+        if token is not None and ring.worker_for(token) != index:
+            return {'moved': True}
+        if op == 'ping':
+            return {'live': len(backend.sessions.live)}
+        if op == 'output':
+            return {'text': await backend.output(token, message['key'])}
+        if op == 'command':
+            return {'ok': await backend.command(token, message['value'])}
+        if op == 'frames':
+            async def send(frame):
+                await send_message(writer, {'frame': frame})
+            pusher = asyncio.create_task(backend.push_frames(token, send))
+            left = asyncio.create_task(reader.read()) # nothing else is sent, so this ends when the front end leaves
+            await asyncio.wait((pusher, left), return_when=asyncio.FIRST_COMPLETED)
+            left.cancel()
+            if not pusher.done():
+                pusher.cancel()
+                return None
+            return {'moved': True} if pusher.result() else {'ended': True}
+        if op == 'membership':
+            ring = HashRing(message['workers'])
+            moved = [token for token in backend.sessions.live if ring.worker_for(token) != index]
+            await asyncio.gather(*(backend.sessions.evict(token) for token in moved)) # on disk before the reply
+            return {'released': len(moved)}
+        if op == 'shutdown':
+            await backend.close()
+            stopped.set()
+            return {}
+        return {'error': f'unknown op {op}'}
+
+    async def handle(reader, writer):
+        try:
+            try:
+                reply = await dispatch(await read_message(reader), reader, writer)
+            except ConnectionError:
+                return
+            except web.HTTPException as e: # refused by the sessions, like when the worker is full
+                reply = {'error': e.text, 'status': e.status}
+            except Exception as e: # a failing command must not take the worker and its other sessions with it
+                logging.exception(f'worker {index} failed a request')
+                reply = {'error': f'{type(e).__name__}: {e}'}
+            if reply is not None:
+                await send_message(writer, reply)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_unix_server(handle, socket_path)
+    await stopped.wait()
+    server.close()
+
+
+class ShardedSessions:
+    '''Sessions spread over worker processes, has the methods of `server.LocalSessions`'''
+    health_interval = 2 # seconds between pings
+    ping_timeout = 5
+    request_timeout = 30
+    start_timeout = 60
+    attempts = 5 # per request, while the ring changes
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.socket_dir = tempfile.mkdtemp(prefix='forestry-')
+        self.context = multiprocessing.get_context('spawn') # no threads or sockets of the front end in the workers
+        self.processes = [None] * workers
+        self.alive = set()
+        self.ring = HashRing([])
+        self.restarting = set()
+        self.settled = asyncio.Event() # cleared while the workers learn about a new ring
+        self.health = None
+
+    def socket_path(self, index: int) -> str:
+        return os.path.join(self.socket_dir, f'worker-{index}.sock')
+
+    def spawn(self, index: int):
+        if os.path.exists(self.socket_path(index)):
+            os.remove(self.socket_path(index))
+        process = self.context.Process(target=worker_main, args=(index, self.socket_path(index), self.workers),
+                                       name=f'forestry worker {index}', daemon=True)
+        process.start()
+        self.processes[index] = process
+
+    async def request(self, index: int, message: dict, timeout: float) -> dict:
+        return await asyncio.wait_for(self.exchange(index, message), timeout)
+
+    async def exchange(self, index: int, message: dict) -> dict:
+        reader, writer = await asyncio.open_unix_connection(self.socket_path(index))
+        try:
+            await send_message(writer, message)
+            return await read_message(reader)
+        finally:
+            writer.close()
+
+    async def wait_ready(self, index: int) -> bool:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.start_timeout
+        while loop.time() < deadline and self.processes[index].is_alive():
+            try:
+                await self.request(index, {'op': 'ping'}, self.ping_timeout)
+                return True
+            except (OSError, asyncio.TimeoutError, ValueError):
+                await asyncio.sleep(0.2)
+        return False
+
+    async def set_membership(self, alive):
+        '''Moves to a new ring, requests wait until every worker released what it no longer owns'''
+        self.settled.clear()
+        try:
+            self.alive = set(alive)
+            self.ring = HashRing(sorted(self.alive))
+            await asyncio.gather(*(self.request(index, {'op': 'membership', 'workers': sorted(self.alive)}, self.request_timeout)
+                                   for index in self.alive), return_exceptions=True)
+        finally:
+            self.settled.set()
+
+    async def start(self):
+        for index in range(self.workers):
+            self.spawn(index)
+        ready = await asyncio.gather(*(self.wait_ready(index) for index in range(self.workers)))
+        await self.set_membership(index for index, ok in enumerate(ready) if ok)
+        for index, ok in enumerate(ready):
+            if not ok:
+                self.worker_failed(index)
+        self.health = asyncio.create_task(self.check_health())
+
+    async def check_health(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            async def ping(index):
+                if not self.processes[index].is_alive():
+                    self.worker_failed(index)
+                    return
+                try:
+                    await self.request(index, {'op': 'ping'}, self.ping_timeout)
+                except (OSError, asyncio.TimeoutError, ValueError):
+                    self.worker_failed(index)
+            await asyncio.gather(*(ping(index) for index in self.alive - self.restarting))
+
+    def worker_failed(self, index: int):
+        if index in self.restarting:
+            return
+        logging.warning(f'worker {index} is not responding, restarting it')
+        self.restarting.add(index)
+        asyncio.create_task(self.restart(index))
+
+    async def restart(self, index: int):
+        try:
+            await self.set_membership(self.alive - {index}) # its sessions go to the others meanwhile
+            process = self.processes[index]
+            if process.is_alive():
+                process.kill()
+            await asyncio.get_running_loop().run_in_executor(None, process.join)
+            self.spawn(index)
+            if await self.wait_ready(index):
+                await self.set_membership(self.alive | {index})
+                logging.info(f'worker {index} is back')
+        finally:
+            self.restarting.discard(index)
+
+    async def routed(self, token: str, message: dict) -> dict:
+        '''
+        Sends to the worker of the session, again with the current ring if it
+        moved or its worker can't be reached. Only the health checks restart
+        workers, a request that fails or takes too long fails alone.
+        '''
+        for _ in range(self.attempts):
+            await self.settled.wait()
+            if not self.ring:
+                break
+            index = self.ring.worker_for(token)
+            try:
+                reply = await self.request(index, {**message, 'token': token}, self.request_timeout)
+            except asyncio.TimeoutError:
+                raise web.HTTPGatewayTimeout(text='The game took too long to answer')
+            except (OSError, ValueError): # down, the health checks take it off the ring meanwhile
+                await asyncio.sleep(self.health_interval)
+                continue
+            if 'error' in reply:
+                if reply.get('status') == web.HTTPServiceUnavailable.status_code:
+                    raise web.HTTPServiceUnavailable(text=reply['error'])
+                raise web.HTTPInternalServerError(text=reply['error'])
+            if not reply.get('moved'):
+                return reply
+            await asyncio.sleep(0.05)
+        raise web.HTTPServiceUnavailable(text='No worker could take the session, try again')
+
+    async def resolve(self, token) -> str:
+        if token is not None and TOKEN_PATTERN.fullmatch(token):
+            return token
+        return secrets.token_urlsafe(24)
+
+    async def output(self, token, key) -> str:
+        return (await self.routed(token, {'op': 'output', 'key': key}))['text']
+
+    async def command(self, token, value) -> bool:
+        return (await self.routed(token, {'op': 'command', 'value': value}))['ok']
+
+    async def push_frames(self, token, send):
+        '''Streams the frames of the session, following it to its next worker when it moves'''
+        failures = 0 # moves in a row without a frame in between
+        while failures < self.attempts:
+            failures += 1
+            await self.settled.wait()
+            if not self.ring:
+                return
+            index = self.ring.worker_for(token)
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.socket_path(index))
+            except OSError:
+                await asyncio.sleep(self.health_interval)
+                continue
+            try:
+                await send_message(writer, {'op': 'frames', 'token': token})
+                while True:
+                    try:
+                        message = await read_message(reader)
+                    except (ConnectionError, ValueError): # the worker went down
+                        message = {'moved': True}
+                    if 'frame' not in message:
+                        break
+                    await send(message['frame'])
+                    failures = 0
+            finally:
+                writer.close()
+            if message.get('ended'):
+                return
+            if 'error' in message:
+                logging.error(f'pushing the frames of session {token} failed: {message["error"]}')
+                return
+            await asyncio.sleep(0.05)
+
+    async def close(self):
+        if self.health is not None:
+            self.health.cancel()
+        await asyncio.gather(*(self.request(index, {'op': 'shutdown'}, self.request_timeout) for index in self.alive),
+                             return_exceptions=True)
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            if process is not None:
+                await loop.run_in_executor(None, process.join, self.request_timeout)
+        shutil.rmtree(self.socket_dir, ignore_errors=True)
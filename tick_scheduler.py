@@ -0,0 +1,131 @@
+'''
+One scheduler ticking many games, instead of a real-time thread per game.
+
+Games are registered with their own tick duration and kept in a heap by the
+time of their next tick. A single asyncio task sleeps until the earliest
+one is due, then advances every game that is due as one batch, inline or on
+a small thread pool. `Game.advance` ends with `state_updated`, which renders
+the game or notifies its listeners. A game that fell behind, because the
+loop was busy or its batch took long, catches up with one `advance(ticks)`
+that draws the production of all missed ticks at once, up to
+`max_catch_up` ticks.
+
+Commands may run on the event loop while a worker ticks the same game,
+`Game.state_lock` keeps them apart.
+'''
+import asyncio
+import heapq
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from forestry import Game
+
+
+class _Entry:
+    def __init__(self, tick_duration):
+        self.tick_duration = tick_duration
+        self.due = None # loop time of the next tick, None while paused
+        self.version = 0 # heap items of older versions are stale
+
+
+class TickScheduler:
+    max_catch_up = 60 # ticks a game makes up for at most, the rest of a stall is skipped
+
+    def __init__(self, workers=0):
+        self.entries: Dict[Game, _Entry] = {}
+        self.heap: List[Tuple[float, int, int, Game]] = [] # (due, order, version, game)
+        self.order = itertools.count() # games never get compared
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='ticks') if workers else None
+        self.changed = asyncio.Event()
+        self.task = None
+
+    def now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def push(self, game: Game, entry: _Entry):
+        entry.version += 1
+        heapq.heappush(self.heap, (entry.due, next(self.order), entry.version, game))
+        self.changed.set()
+
+    def add(self, game: Game, tick_duration=None):
+        '''Ticks `game` every `tick_duration` seconds, its own `tick_duration` if not given'''
+        entry = self.entries[game] = _Entry(tick_duration or game.tick_duration)
+        entry.due = self.now() + entry.tick_duration
+        self.push(game, entry)
+
+    def remove(self, game: Game):
+        self.entries.pop(game, None) # its heap items are skipped when they come up
+
+    def pause(self, game: Game):
+        entry = self.entries[game]
+        entry.due = None
+        entry.version += 1
+
+    def resume(self, game: Game):
+        entry = self.entries[game]
+        if entry.due is None:
+            entry.due = self.now() + entry.tick_duration
+            self.push(game, entry)
+
+    def is_paused(self, game: Game) -> bool:
+        return self.entries[game].due is None
+
+    def set_tick_duration(self, game: Game, tick_duration):
+        entry = self.entries[game]
+        entry.tick_duration = tick_duration
+        if entry.due is not None:
+            entry.due = self.now() + tick_duration
+            self.push(game, entry)
+
+    def pop_due(self, now) -> List[Tuple[Game, int]]:
+        '''Games due by `now` with the number of ticks they owe, rescheduled already'''
+        batch = []
+        while self.heap and self.heap[0][0] <= now:
+            due, _, version, game = heapq.heappop(self.heap)
+            entry = self.entries.get(game)
+            if entry is None or entry.version != version:
+                continue
+            ticks = min(1 + int((now - due) // entry.tick_duration), self.max_catch_up)
+            entry.due = due + ticks * entry.tick_duration
+            if entry.due <= now: # skipped part of a stall
+                entry.due = now + entry.tick_duration
+            self.push(game, entry)
+            batch.append((game, ticks))
+        return batch
+
+    def advance(self, game: Game, ticks: int):
+        try:
+            game.advance(ticks)
+        except Exception:
+            logging.exception('a game failed to tick and was removed from the scheduler')
+            self.remove(game)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self.changed.clear()
+            delay = self.heap[0][0] - loop.time() if self.heap else None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self.changed.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            batch = self.pop_due(loop.time())
+            if self.executor is None:
+                for game, ticks in batch:
+                    self.advance(game, ticks)
+            else:
+                await asyncio.gather(*(loop.run_in_executor(self.executor, self.advance, game, ticks)
+                                       for game, ticks in batch))
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
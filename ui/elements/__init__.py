@@ -1,6 +1,6 @@
 from .ui_checkbox import UICheckbox
 from .ui_floating_text_box import UIFloatingTextBox
-from .ui_grid_window import UIGridPanel, UIGridWindow
+from .ui_grid_window import UIGridPanel, UIGridWindow, UIVirtualGridPanel
 from .ui_location_finding_windows import (UILocationFindingConfirmationDialog,
                                           UILocationFindingMessageWindow,
                                           UILocationFindingWindow)
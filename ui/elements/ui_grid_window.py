@@ -115,6 +115,111 @@ class UIGridPanel(UIPanel):
     #             print('killed', subelement)
     #             subelement.kill()
 
+class UIVirtualGridPanel(UIPanel):
+    """
+    Grid of same-sized elements that only exist for the visible cells.
+    `create_element(index, container)` makes the element for item `index` and
+    `set_element(element, index)` points an existing element at another item,
+    so elements scrolled out of view are reused for the ones scrolled in.
+    Call `refresh` when items were added or removed and `refresh_items` when
+    some of them changed in place.
+    """
+    def __init__(self, relative_rect: pygame.Rect, starting_layer_height: int, manager: IUIManagerInterface, element_size: Tuple[int, int], item_count: Callable[[], int], create_element: Callable[[int, IContainerLikeInterface], UIElement], set_element: Callable[[UIElement, int], None], *, element_id: str = 'panel', margins: Dict[str, int] = None, container: Union[IContainerLikeInterface, None] = None, parent_element: UIElement = None, object_id: Union[ObjectID, str, None] = None, anchors: Dict[str, str] = None, visible: int = 1, min_marginx: int = 0, min_marginy: int = 0):
+        self.subelement_size = element_size
+        self.item_count = item_count
+        self.create_element = create_element
+        self.set_element = set_element
+        self.min_marginx = min_marginx
+        self.min_marginy = min_marginy
+        self.total_rows = 0
+        self.total_columns = 1
+        self.total_height = 0
+        self.elements : Dict[int, UIElement] = {} # item index -> element showing it
+        self.spare_elements : List[UIElement] = []
+
+        self.scroll_bar = None
+        self.scroll_bar_width = 20
+        super().__init__(relative_rect, starting_layer_height, manager, element_id=element_id, margins=margins, container=container, parent_element=parent_element, object_id=object_id, anchors=anchors, visible=visible)
+        self.refresh()
+
+    def layout(self):
+        count = self.item_count()
+        width = self.get_container().get_abs_rect().width
+        height = self.get_container().get_abs_rect().height
+        for available_space in (width, width - self.scroll_bar_width):
+            self.total_columns = max(1, available_space // (self.subelement_size[0] + self.min_marginx))
+            self.total_rows = -(-count // self.total_columns)
+            self.total_height = self.min_marginy * (self.total_rows + 1) + self.subelement_size[1] * self.total_rows
+            if self.total_height <= height:
+                break
+        if self.total_height <= height:
+            if self.scroll_bar is not None:
+                self.scroll_bar.kill()
+                self.scroll_bar = None
+        elif self.scroll_bar is None:
+            scroll_bar_rect = pygame.Rect(width - self.scroll_bar_width, 0, self.scroll_bar_width, height)
+            self.scroll_bar = UIVerticalScrollBar(scroll_bar_rect, height / self.total_height, self.ui_manager, self, visible=self.visible)
+        else:
+            self.scroll_bar.set_visible_percentage(height / self.total_height)
+            self.scroll_bar.set_relative_position((width - self.scroll_bar_width, 0))
+            self.scroll_bar.set_dimensions((self.scroll_bar_width, height))
+
+    def visible_items(self):
+        count = self.item_count()
+        if count == 0:
+            return range(0)
+        row_height = self.subelement_size[1] + self.min_marginy
+        offset = self.scroll_bar.start_percentage * self.total_height if self.scroll_bar is not None else 0
+        first_row = int(offset // row_height)
+        last_row = int((offset + self.get_container().get_abs_rect().height) // row_height)
+        return range(first_row * self.total_columns, min(count, (last_row + 1) * self.total_columns))
+
+    def place_elements(self, reassign=False):
+        '''Gives every visible item an element, reusing the ones that went out of view'''
+        visible_items = self.visible_items()
+        for index in list(self.elements):
+            if index not in visible_items:
+                element = self.elements.pop(index)
+                element.hide()
+                self.spare_elements.append(element)
+        offset = self.scroll_bar.start_percentage * self.total_height if self.scroll_bar is not None else 0
+        for index in visible_items:
+            element = self.elements.get(index)
+            if element is None:
+                if self.spare_elements:
+                    element = self.spare_elements.pop()
+                    self.set_element(element, index)
+                    element.show()
+                else:
+                    element = self.create_element(index, self)
+                self.elements[index] = element
+            elif reassign:
+                self.set_element(element, index)
+            j, i = index // self.total_columns, index % self.total_columns
+            element.set_relative_position((self.min_marginx * (i+1) + self.subelement_size[0] * i,
+                                           self.min_marginy * (j+1) + self.subelement_size[1] * j - offset))
+
+    def refresh(self):
+        '''Items were added, removed or reordered: every visible element may show another item now'''
+        self.layout()
+        self.place_elements(reassign=True)
+
+    def refresh_items(self, indices: List[int]):
+        for index in indices:
+            element = self.elements.get(index)
+            if element is not None:
+                self.set_element(element, index)
+
+    def set_dimensions(self, dimensions: Union[pygame.math.Vector2, Tuple[int, int], Tuple[float, float]]):
+        super().set_dimensions(dimensions)
+        self.layout()
+        self.place_elements()
+
+    def update(self, time_delta: float):
+        super().update(time_delta)
+        if self.scroll_bar is not None and self.scroll_bar.check_has_moved_recently():
+            self.place_elements()
+
 class UIGridWindow(UIWindow):
     def __init__(self, rect: pygame.Rect, manager: IUIManagerInterface, window_display_title: str = "", element_id: Union[str, None] = None, object_id: Union[ObjectID, str, None] = None, resizable: bool = False, visible: int = 1, min_marginx: int = 0, min_marginy: int = 0, subelements_function: Callable[['UIGridWindow'], List[UIElement]] = None):
         self.subelements_function = subelements_function
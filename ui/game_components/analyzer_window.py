@@ -75,13 +75,15 @@ class AnalyzerWindow(UICustomTitleBarWindow):
                     else:
                         self.analyzer.put(self.cursor.slot.slot) # put one
                         self.cursor.slot.take()
+                self.analyzer.wake() # the slot may have been changed directly
 
         return super().process_event(event)
 
     def update(self, time_delta: float):
         super().update(time_delta)
-        if self.analyzer.time_left is not None:
-            self.tick_status_bar.percent_full = self.analyzer.time_left / self.analyzer.time_to_analyze
+        time_left = self.analyzer.current_time_left()
+        if time_left is not None:
+            self.tick_status_bar.percent_full = time_left / self.analyzer.time_to_analyze
         else:
             self.tick_status_bar.percent_full = 0
         text = []
@@ -154,6 +154,7 @@ class ApiaryWindow(UIWindow):
                             self.apiary.inv[index].put(bee, amt)
                     else:
                         self.cursor.process_cursor_slot_interaction(event, b.slot)
+            self.apiary.wake() # slots may have been changed directly
         return super().process_event(event)
 
     def update(self, time_delta):
@@ -1,7 +1,6 @@
 import logging
 import os
 from enum import IntEnum
-from traceback import print_exc
 from typing import Union
 
 import pygame
@@ -11,9 +10,10 @@ from pygame_gui.windows import UIMessageWindow
 
 from config import (ANALYZER_WINDOW_SIZE, INVENTORY_WINDOW_SIZE, APIARY_WINDOW_SIZE,
                     UI_MESSAGE_SIZE, ResourceTypes,
-                    config_production_modifier, helper_text, local)
+                    config_production_modifier, helper_text, load_settings, local)
 from forestry import Achievement, Alveary, Analyzer, Apiary, Game, Inventory, Slot
-from migration import CURRENT_FRONT_VERSION, update_front_versions
+from migration import CURRENT_FRONT_VERSION
+from persistence import catalog
 
 from ..custom_events import (INSPECT_BEE, INVENTORY_RENAMED,
                              TUTORIAL_STAGE_CHANGED, SET_MOST_RECENT_INVENTORY)
@@ -30,7 +30,7 @@ class GUI(Game):
         super().restart_game()
 
         CurrentTutorialStage.current_tutorial_stage = TutorialStage.BEFORE_FORAGE
-        if not os.path.exists('saves') or len(list(filter(lambda x: x.endswith('.forestry'), os.listdir('saves')))) == 0:
+        if len(catalog.entries()) == 0:
             self.help_window()
 
         self.cursor = Cursor(Slot(), pygame.Rect(0, 0, 64, 64), '', self.cursor_manager)
@@ -221,6 +221,11 @@ class GUI(Game):
 
         super().__init__()
 
+        settings = load_settings()
+        self.save_compression = settings['save_compression']
+        if settings['autosave_interval'] > 0:
+            self.start_autosave(settings['autosave_interval'], settings['autosave_slots'])
+
         if not new_game:
             self.load_last()
 
@@ -287,8 +292,10 @@ class GUI(Game):
         return UILocationFindingMessageWindow(r, local['mendel_notification'], self.ui_manager)
 
     def open_load_file_selection_list(self):
+        saves = catalog.entries()
+        newest_first = sorted(saves, key=lambda name: saves[name]['mtime'], reverse=True)
         self.load_file_selection_list = UIPickList(pygame.Rect(0, self.esc_menu.get_abs_rect().top, self.esc_menu_width, 500),
-                                                   self.get_save_names_list(),
+                                                   newest_first,
                                                    manager=self.cursor_manager,
                                                    anchors={'left_target': self.esc_menu})
 
@@ -602,17 +609,10 @@ class GUI(Game):
 
     def load(self, name):
         try:
-            state = super().load(name)
+            state = super().load(name) # migrates the front as well
         except FileNotFoundError:
             return
 
-        try:
-            if state.get('front_version', 0) < CURRENT_FRONT_VERSION:
-                for update_front_func in update_front_versions[state.get('front_version', 0):]:
-                    state = update_front_func(state)
-        except Exception:
-            print_exc()
-            self.exit()
         for window in self.apiary_windows:
             window.kill()
         for window in self.inventory_windows:
@@ -627,7 +627,7 @@ class GUI(Game):
 
         self.cursor.slot = state['cursor_slot']
 
-        CurrentTutorialStage.current_tutorial_stage = state['current_tutorial_stage']
+        CurrentTutorialStage.current_tutorial_stage = TutorialStage(state['current_tutorial_stage'])
         if state['current_tutorial_stage'] >= TutorialStage.RESOURCES_AVAILABLE:
             self.bestiary_button.show()
             self.achievements_button.show()
@@ -642,14 +642,15 @@ class GUI(Game):
         if state['apiary_list_opened']:
             logging.debug('open apiary_selection in load')
             self.open_apiary_selection_list()
-        self.inspect_windows = [InspectWindow(self, self.cursor, rect, self.ui_manager) for rect in state['inspect_windows']]
+        # binary saves hold rects as tuples
+        self.inspect_windows = [InspectWindow(self, self.cursor, pygame.Rect(rect), self.ui_manager) for rect in state['inspect_windows']]
         for window, slot in zip(self.inspect_windows, state['inspect_slots']):
             window.bee_button.slot = slot
             window.bee_stats.bee = slot.slot # TODO: some stupid initialization here, rework?
             window.reshape_according_to_bee_stats()
-        self.inventory_windows = [InventoryWindow(state['inventories'][inv_name], self.cursor, rect, self.ui_manager) for inv_name, rect in state['inventory_windows']]
-        self.apiary_windows = [ApiaryWindow(self, api, self.cursor, rect, self.ui_manager) for api, rect in state['apiary_windows']]
-        self.analyzer_windows = [AnalyzerWindow(self.analyzers[index], self.cursor, rect, self.ui_manager) for index, rect in enumerate(state.get('analyzer_windows', []))]
+        self.inventory_windows = [InventoryWindow(state['inventories'][inv_name], self.cursor, pygame.Rect(rect), self.ui_manager) for inv_name, rect in state['inventory_windows']]
+        self.apiary_windows = [ApiaryWindow(self, api, self.cursor, pygame.Rect(rect), self.ui_manager) for api, rect in state['apiary_windows']]
+        self.analyzer_windows = [AnalyzerWindow(self.analyzers[index], self.cursor, pygame.Rect(rect), self.ui_manager) for index, rect in enumerate(state.get('analyzer_windows', []))]
         if self.mating_history_window is not None:
             self.mating_history_window.mating_history = self.mating_history
             self.mating_history.something_changed = True
@@ -17,18 +17,35 @@ class MatingEntryPanel(UIGridPanel):
         relative_rect.size = (518, 70)
         super().__init__(relative_rect, starting_layer_height, manager, element_id=element_id, margins=margins, container=container, parent_element=parent_element, object_id=object_id, anchors=anchors, visible=visible, subelements_function=self.subelements_method)
 
-    def subelements_method(self, container):
-        buttons = []
+    def slot_contents(self):
+        '''(bee, amount) for each of the six bee slots, (None, 0) for hidden recessive alleles'''
+        contents = []
         for index, (cls, allele, inspected) in enumerate(zip(
                 [Princess, Princess, Drone, Drone, Drone, Drone],
                 [self.entry.parent1_dom, self.entry.parent1_rec, self.entry.parent2_dom, self.entry.parent2_rec, self.entry.child_dom, self.entry.child_rec],
                 [self.entry.parent1_inspected, self.entry.parent1_inspected, self.entry.parent2_inspected, self.entry.parent2_inspected, self.entry.child_inspected, self.entry.child_inspected])):
             if index % 2 == 1 and not inspected:
-                slot = Slot()
+                contents.append((None, 0))
             else:
-                bee = cls(Genes((allele, allele), None, None, None), inspected=inspected)
-                slot = Slot(bee, self.count)
+                contents.append((cls(Genes((allele, allele), None, None, None), inspected=inspected), self.count))
+        return contents
+
+    def subelements_method(self, container):
+        buttons = []
+        for bee, amount in self.slot_contents():
+            slot = Slot(bee, amount)
             buttons.append(UIButtonSlot(slot, pygame.Rect(0, 0, 64, 64), '', self.ui_manager, container=container, is_inspectable=False))
+        self.slot_buttons = list(buttons)
         buttons.insert(2, UIButton(pygame.Rect(0, 0, 64, 64), '', self.ui_manager, container=container, object_id='#mating_history_plus_button'))
         buttons.insert(5, UIButton(pygame.Rect(0, 0, 64, 64), '', self.ui_manager, container=container, object_id='#mating_history_right_arrow_button'))
-        return buttons
\ No newline at end of file
+        return buttons
+
+    def set_entry(self, count: int, entry: MatingEntry):
+        '''Shows another entry with the same widgets, the slot buttons redraw themselves on update'''
+        if count == self.count and entry == self.entry:
+            return
+        self.count = count
+        self.entry = entry
+        for button, (bee, amount) in zip(self.slot_buttons, self.slot_contents()):
+            button.slot.take_all()
+            button.slot.put(bee, amount)
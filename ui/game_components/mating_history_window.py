@@ -2,31 +2,55 @@ from typing import Union
 
 import pygame
 from pygame_gui.core import ObjectID
+from pygame_gui.elements import UIWindow
 
 from forestry import MatingHistory
 
-from ..elements import UIGridWindow
+from ..elements import UIVirtualGridPanel
 from . import MatingEntryPanel
 
 
-class MatingHistoryWindow(UIGridWindow):
+class MatingHistoryWindow(UIWindow):
+    """Only the rows in view have widgets, and rows that changed are updated in place"""
+    entry_panel_size = (518, 70)
     def __init__(self, mating_history: MatingHistory, rect: pygame.Rect, manager, window_display_title: str = "", element_id: Union[str, None] = None, object_id: Union[ObjectID, str, None] = None, visible: int = 1):
         self.mating_history = mating_history
-        super().__init__(rect, manager, window_display_title, element_id, object_id, True, visible, 0, 0, self.subelements_method)
+        self.grid_panel = None
+        super().__init__(rect, manager, window_display_title, element_id, object_id, True, visible)
+        self.create_grid_panel()
+        self.mating_history.acknowledge_changes()
 
-    def subelements_method(self, container):
-        entry_panels = []
-        for index, (entry, count) in enumerate(zip(*self.mating_history.get_history_counts())):
-            entry_panels.append(MatingEntryPanel(count, entry, pygame.Rect(0,70*index,0,0), 0, self.ui_manager, container=container))
-        return entry_panels
+    def create_grid_panel(self):
+        if self.grid_panel is None:
+            self.grid_panel = UIVirtualGridPanel(pygame.Rect((0, 0), self.get_container().get_size()), 0, self.ui_manager,
+                                                 self.entry_panel_size, self.rows_count,
+                                                 self.create_entry_panel, self.set_entry_panel,
+                                                 container=self.get_container())
+            self.set_minimum_dimensions((self.entry_panel_size[0] + self.grid_panel.scroll_bar_width + 2 * self.border_width + 2 * self.grid_panel.border_width,
+                                         self.entry_panel_size[1] + 2 * self.border_width + 2 * self.grid_panel.border_width))
+
+    def rows_count(self):
+        return self.mating_history.front_rows_count()
+
+    def create_entry_panel(self, row: int, container):
+        entry, count = self.mating_history.get_front_row(row)
+        return MatingEntryPanel(count, entry, pygame.Rect(0, 0, 0, 0), 0, self.ui_manager, container=container)
+
+    def set_entry_panel(self, panel: MatingEntryPanel, row: int):
+        entry, count = self.mating_history.get_front_row(row)
+        panel.set_entry(count, entry)
+
+    def set_dimensions(self, dimensions):
+        super().set_dimensions(dimensions)
+        if self.grid_panel is not None:
+            self.grid_panel.set_dimensions(self.get_container().get_size())
 
     def update(self, time_delta: float):
         if self.mating_history.something_changed:
-            # print(f'something changed, so kill, {time.time() - self.timer}')
-            if self.grid_panel is not None:
-                self.grid_panel.hide() # this should hide the buttons too
-                self.grid_panel.kill() # investigate the killing with grid_panel.kill doesn't kill the buttons inside
-                self.grid_panel = None
-            self.set_subelements()
+            changed_rows = self.mating_history.get_changed_rows()
+            if changed_rows is None:
+                self.grid_panel.refresh()
+            else:
+                self.grid_panel.refresh_items(changed_rows)
             self.mating_history.acknowledge_changes()
         return super().update(time_delta)
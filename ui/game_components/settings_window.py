@@ -146,7 +146,7 @@ class SettingsWindow(UIWindow):
         return consume
 
     def persist_settings(self, filename='settings.yaml'):
-        settings = {}
+        settings = dict(self.settings) # keep the settings that have no controls here
         settings['fullscreen'] = self.full_screen_checkbox.is_selected
         settings['click_volume'] = self.click_volume_slider.current_value / 100
         settings['master_volume'] = self.master_volume_slider.current_value / 100